@@ -0,0 +1,75 @@
+"""
+_build_context 微基准：比较全量重建与增量缓存在历史增长时的单次构建耗时。
+
+用法: python benchmarks/bench_context.py [总轮数] [采样间隔]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.agent import ScamAgent
+
+
+def make_agents(n=7):
+    return [
+        ScamAgent({
+            "id": f"agent_{i:02d}",
+            "name": f"角色{i}",
+            "system_prompt": "你正在参与一次角色扮演模拟。",
+            "api_key": "bench",
+            "base_url": "http://127.0.0.1:9/v1",
+        })
+        for i in range(n)
+    ]
+
+
+def fake_entry(agent, turn):
+    return {
+        "role_id": agent.id,
+        "role_name": agent.name,
+        "content": f"第 {turn} 轮发言，" + "内容" * 40,
+        "timestamp": "2026-01-01T00:00:00",
+        "internal_thoughts": [],
+    }
+
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    step = int(sys.argv[2]) if len(sys.argv) > 2 else 250
+
+    agents = make_agents()
+    history = []
+    print(f"{'历史长度':>8} | {'全量重建(ms)':>12} | {'增量缓存(ms)':>12}")
+    print("-" * 40)
+    for turn in range(turns):
+        speaker = agents[turn % len(agents)]
+        # 模拟 auto：每个角色发言前都会构建一次上下文
+        speaker._build_context(history)
+        history.append(fake_entry(speaker, turn))
+
+        if (turn + 1) % step == 0:
+            probe = agents[(turn + 1) % len(agents)]
+
+            def full():
+                probe.invalidate_context()
+                probe._build_context(history)
+
+            full_ms = timed(full) * 1000
+            probe._build_context(history)
+            incremental_ms = timed(lambda: probe._build_context(history)) * 1000
+            print(f"{len(history):>8} | {full_ms:>12.3f} | {incremental_ms:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+历史记录内存基准：比较原始 list[dict] 与 core.history.History 在 1 万、10 万轮时的内存占用。
+
+用法: python benchmarks/bench_history_memory.py [轮数 ...]
+"""
+import gc
+import os
+import sys
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.history import History
+
+AGENTS = [(f"agent_{i:02d}", f"角色{i}") for i in range(7)]
+
+
+def make_entry(turn, start):
+    role_id, role_name = AGENTS[turn % len(AGENTS)]
+    thoughts = []
+    if turn % 5 == 0:
+        call_id = f"call_{turn}"
+        thoughts = [
+            {"role": "assistant", "content": "", "tool_calls": [
+                {"id": call_id, "type": "function", "function": {"name": "query_balance", "arguments": "{\"account\": \"6222\"}"}}
+            ]},
+            {"role": "tool", "tool_call_id": call_id, "name": "query_balance", "content": "余额: 12000.00 元"},
+        ]
+    return {
+        # 模拟从 JSON 读入的数据：每条消息都有独立的字符串对象
+        "role_id": "".join(role_id),
+        "role_name": "".join(role_name),
+        "content": f"第 {turn} 轮发言：" + "内容" * 30,
+        "timestamp": (start + timedelta(seconds=turn, microseconds=turn % 997)).isoformat(),
+        "internal_thoughts": thoughts,
+        "metrics": {"total": 1.234, "ttft": 0.456, "iterations": 1 + (turn % 5 == 0)},
+    }
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del obj
+    return current
+
+
+def main():
+    sizes = [int(n) for n in sys.argv[1:]] or [10_000, 100_000]
+    start = datetime(2026, 1, 1)
+
+    print(f"{'轮数':>8} | {'list[dict] (MB)':>15} | {'History (MB)':>12} | {'节省':>6}")
+    print("-" * 52)
+    for n in sizes:
+        # 各自独立构造，避免共享对象影响统计
+        baseline = measure(lambda: [make_entry(t, start) for t in range(n)])
+
+        def build_history():
+            history = History()
+            for t in range(n):
+                history.append(make_entry(t, start))
+            return history
+
+        compact = measure(build_history)
+        saved = 1 - compact / baseline
+        print(f"{n:>8} | {baseline / 2**20:>15.1f} | {compact / 2**20:>12.1f} | {saved:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+CLI 启动耗时基准：在全新子进程中测量导入 main 的耗时、离线模式 (--no-init) 启动到退出的耗时，
+以及被推迟导入的重型依赖（openai、langchain_core、langchain_mcp_adapters）各自的导入开销。
+
+用法: python benchmarks/bench_import.py [重复次数] [--root 其他检出目录]
+  --root 测量另一份检出（如 git worktree add ../baseline <提交>），便于前后对比
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 启动时不再导入、改为首次使用时导入的依赖
+DEFERRED_MODULES = [
+    "openai",
+    "httpx",
+    "langchain_core.tools",
+    "langchain_core.utils.function_calling",
+    "langchain_mcp_adapters.client",
+    "tiktoken",
+]
+
+
+def run_python(code_or_args, cwd=None, stdin=None):
+    args = code_or_args if isinstance(code_or_args, list) else ["-c", code_or_args]
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, *args], cwd=cwd or ROOT, input=stdin, capture_output=True, text=True)
+    return time.perf_counter() - start, result
+
+
+def best_of(repeat, code_or_args, **kwargs):
+    best, last = float("inf"), None
+    for _ in range(repeat):
+        elapsed, last = run_python(code_or_args, **kwargs)
+        best = min(best, elapsed)
+    return best, last
+
+
+def heavy_imports_at_startup():
+    """导入 main 之后已加载的重型依赖（应为空）"""
+    code = ("import sys, main; print(','.join(m for m in %r if m in sys.modules))" % (DEFERRED_MODULES,))
+    _, result = run_python(code)
+    return result.stdout.strip() or "无"
+
+
+def top_imports(limit=10):
+    """python -X importtime 中累计耗时最高的模块"""
+    _, result = run_python(["-X", "importtime", "-c", "import main"])
+    rows = []
+    for line in result.stderr.splitlines():
+        # 格式: "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(cumulative_us), name.strip()))
+    rows.sort(reverse=True)
+    return rows[:limit]
+
+
+def main():
+    global ROOT
+    parser = argparse.ArgumentParser(description="CLI 启动耗时基准")
+    parser.add_argument("repeat", nargs="?", type=int, default=5, help="每项重复次数，取最快一次")
+    parser.add_argument("--root", default=ROOT, help="被测项目目录，默认为本仓库")
+    args = parser.parse_args()
+    ROOT = os.path.abspath(args.root)
+    repeat = args.repeat
+
+    baseline, _ = best_of(repeat, "pass")
+    import_main, result = best_of(repeat, "import main")
+    if result.returncode != 0:
+        print(f"导入 main 失败:\n{result.stderr}")
+        return
+
+    # 离线模式：临时目录中的最小配置，输入 exit 后退出
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, "config.json"), 'w', encoding='utf-8') as f:
+            f.write('{"save_on_exit": false}')
+        with open(os.path.join(workdir, "user.json"), 'w', encoding='utf-8') as f:
+            f.write('[]')
+        offline, result = best_of(repeat, [os.path.join(ROOT, "main.py"), "--no-init"], cwd=workdir, stdin="exit\n")
+        if result.returncode != 0:
+            # 旧版本没有 --no-init
+            print(f"离线模式启动失败:\n{result.stderr}")
+            offline = None
+
+    print(f"解释器空启动:            {baseline * 1000:8.1f} ms")
+    print(f"import main:             {import_main * 1000:8.1f} ms (扣除空启动 {(import_main - baseline) * 1000:.1f} ms)")
+    if offline is not None:
+        print(f"main.py --no-init 到退出: {offline * 1000:8.1f} ms")
+    print(f"import main 后已加载的重型依赖: {heavy_imports_at_startup()}")
+
+    print("\n被推迟的依赖单独导入耗时（首次发言时才支付）:")
+    for module in DEFERRED_MODULES:
+        elapsed, result = best_of(repeat, f"import {module}")
+        if result.returncode != 0:
+            print(f"  {module:40} 未安装")
+        else:
+            print(f"  {module:40} {(elapsed - baseline) * 1000:8.1f} ms")
+
+    print("\nimport main 累计耗时最高的模块 (-X importtime):")
+    for cumulative_us, name in top_imports():
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
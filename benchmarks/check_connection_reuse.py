@@ -0,0 +1,124 @@
+"""
+连接复用检查：多个 DialogueManager 的角色共享同一个 ClientRegistry，在本地桩服务（stub_openai.py）上
+并发多轮对话，断言新建的 TCP 连接数不超过同时在途的请求数（即连接来自连接池复用，而非每个请求/角色各建一个），
+并断言 ClientRegistry.aclose() 关闭了共享连接池、服务端不再有打开的连接。
+
+用法: python benchmarks/check_connection_reuse.py [--managers 2] [--agents 3] [--rounds 5]
+检查失败时以非零状态码退出。
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from core.http_pool import ClientRegistry
+from core.manager import DialogueManager
+
+from stub_openai import StubOpenAIServer
+
+
+def write_fixtures(workdir, base_url, index, agents):
+    """一个对话的 config.json / user.json：所有角色同组并发发言，不挂载工具"""
+    config = {
+        "max_rounds": -1,
+        "stream": False,
+        "scheduler": {"policy": "parallel"},
+        "journal": {"enabled": False},
+        "replay": {"mode": "passthrough", "dir": os.path.join(workdir, "replay")},
+        "mcp_registry": {},
+    }
+    users = [
+        {
+            "id": f"agent_{index}_{i}",
+            "name": f"角色{index}-{i}",
+            "system_prompt": "你正在参与一次角色扮演模拟。",
+            "api_key": "check",
+            "base_url": base_url,
+            "model": "stub",
+            "mcp_servers": [],
+        }
+        for i in range(agents)
+    ]
+    config_path = os.path.join(workdir, f"config_{index}.json")
+    user_path = os.path.join(workdir, f"user_{index}.json")
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False)
+    with open(user_path, 'w', encoding='utf-8') as f:
+        json.dump(users, f, ensure_ascii=False)
+    return config_path, user_path
+
+
+def check(condition, message):
+    print(f"  [{'OK' if condition else 'FAIL'}] {message}")
+    return condition
+
+
+async def run(args):
+    server = StubOpenAIServer(latency=args.latency)
+    await server.start()
+    registry = ClientRegistry({"http2": False, "max_retries": 0})
+    passed = True
+    try:
+        with tempfile.TemporaryDirectory(prefix="scam_reuse_") as workdir:
+            managers = []
+            for index in range(args.managers):
+                config_path, user_path = write_fixtures(workdir, server.base_url, index, args.agents)
+                manager = DialogueManager(config_path, user_path, client_registry=registry)
+                await manager.initialize_agents()
+                managers.append(manager)
+
+            # 各对话并发运行，每步所有角色同时请求：同时在途的请求数最多为 managers × agents
+            concurrency = args.managers * args.agents
+            await asyncio.gather(*(m.run_auto(args.rounds) for m in managers))
+            first = server.stats()
+            # 第二段：连接池已预热，不应再新建连接
+            await asyncio.gather(*(m.run_auto(args.rounds) for m in managers))
+            second = server.stats()
+
+            turns = 2 * args.rounds * concurrency
+            print(f"模型请求 {second['requests']} 次 | 新建连接 {second['connections']} 个 | 最大并发 {concurrency}")
+            passed &= check(second["requests"] == turns, f"每个角色每轮一次请求 ({second['requests']} == {turns})")
+            passed &= check(first["connections"] <= concurrency,
+                            f"连接数不超过并发请求数 ({first['connections']} <= {concurrency})")
+            passed &= check(second["connections"] == first["connections"],
+                            f"预热后不再新建连接 ({second['connections']} == {first['connections']})")
+            passed &= check(len(registry._clients) == 1,
+                            f"相同 base_url / api_key 的角色共享同一个 AsyncOpenAI 客户端 ({len(registry._clients)})")
+
+            for manager in managers:
+                await manager.shutdown()
+            http_client = registry.http_client
+            passed &= check(server.stats()["open"] > 0, f"关闭前连接池保持 keep-alive 连接 ({server.stats()['open']})")
+            await registry.aclose()
+            # 等待服务端处理连接关闭
+            for _ in range(50):
+                if server.stats()["open"] == 0:
+                    break
+                await asyncio.sleep(0.01)
+            passed &= check(http_client.is_closed and registry._http_client is None and not registry._clients,
+                            "aclose() 关闭共享的 httpx 连接池并清空客户端")
+            passed &= check(server.stats()["open"] == 0, f"服务端已无打开的连接 ({server.stats()['open']})")
+    finally:
+        await registry.aclose()
+        await server.stop()
+    return passed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="共享连接池的连接复用检查")
+    parser.add_argument("--managers", type=int, default=2, help="共享同一 ClientRegistry 的对话数")
+    parser.add_argument("--agents", type=int, default=3, help="每个对话的角色数")
+    parser.add_argument("--rounds", type=int, default=5, help="每段的自动对话步数（共两段）")
+    parser.add_argument("--latency", type=float, default=0.02, help="桩服务每个请求的延迟（秒），使请求在途时间重叠")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    ok = asyncio.run(run(parse_args()))
+    print("通过" if ok else "失败")
+    sys.exit(0 if ok else 1)
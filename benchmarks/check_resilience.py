@@ -0,0 +1,141 @@
+"""
+重试/熔断/备用模型与限流检查，均在本地桩服务（stub_openai.py）上运行:
+  同一端点上的备用模型：主模型始终返回 503，备用模型与主模型使用同一 base_url（默认配置），断言
+    主模型按 max_attempts 重试后切换到备用模型并得到回复，熔断后的轮次立即切换、不再请求主模型；
+  限流响应头：桩服务按固定窗口限流，断言客户端根据成功响应的 x-ratelimit-* 头在额度用尽时主动等待，
+    流式与非流式请求都不会收到 429。
+
+用法: python benchmarks/check_resilience.py [--turns 3] [--rate-turns 12]
+检查失败时以非零状态码退出。
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from core.manager import DialogueManager
+
+from stub_openai import StubOpenAIServer
+
+RESILIENCE = {"max_attempts": 5, "base_delay": 0.01, "max_delay": 0.05, "failure_threshold": 5,
+              "reset_timeout": 60}
+
+
+def write_fixtures(workdir, base_url, user, stream=False):
+    config = {
+        "max_rounds": -1,
+        "stream": stream,
+        "journal": {"enabled": False},
+        "http": {"http2": False},
+        "resilience": RESILIENCE,
+        "replay": {"mode": "passthrough", "dir": os.path.join(workdir, "replay")},
+        "mcp_registry": {},
+    }
+    users = [dict({
+        "id": "agent",
+        "name": "角色",
+        "system_prompt": "你正在参与一次角色扮演模拟。",
+        "api_key": "check",
+        "base_url": base_url,
+        "model": "stub",
+        "mcp_servers": [],
+    }, **user)]
+    config_path = os.path.join(workdir, "config.json")
+    user_path = os.path.join(workdir, "user.json")
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False)
+    with open(user_path, 'w', encoding='utf-8') as f:
+        json.dump(users, f, ensure_ascii=False)
+    return config_path, user_path
+
+
+def check(condition, message):
+    print(f"  [{'OK' if condition else 'FAIL'}] {message}")
+    return condition
+
+
+async def check_same_endpoint_fallback(args):
+    print("同一端点上的备用模型:")
+    server = StubOpenAIServer(failing_models=["main"])
+    await server.start()
+    passed = True
+    try:
+        with tempfile.TemporaryDirectory(prefix="scam_resilience_") as workdir:
+            # 未设置 fallback_base_url：备用模型与主模型共用端点与客户端
+            manager = DialogueManager(*write_fixtures(workdir, server.base_url,
+                                                      {"model": "main", "fallback_model": "fb"}))
+            try:
+                await manager.initialize_agents()
+                entries = []
+                for _ in range(args.turns):
+                    try:
+                        entries.append(await manager.agent_speak("agent"))
+                    except Exception as e:
+                        print(f"  发言失败: {type(e).__name__}: {e}")
+                        break
+                requests = dict(server.model_requests)
+                print(f"  请求数: {requests}")
+                passed &= check(len(entries) == args.turns, f"每轮都得到回复 ({len(entries)} / {args.turns})")
+                passed &= check(bool(entries) and all(e["metrics"].get("fallbacks") == 1 for e in entries),
+                                "每轮都切换到了备用模型")
+                passed &= check(requests.get("main") == RESILIENCE["max_attempts"],
+                                f"主模型只在首轮重试，熔断后不再请求 ({requests.get('main')} == {RESILIENCE['max_attempts']})")
+                passed &= check(requests.get("fb") == args.turns, f"备用模型每轮一次请求 ({requests.get('fb')})")
+            finally:
+                await manager.shutdown()
+    finally:
+        await server.stop()
+    return passed
+
+
+async def check_rate_limit_headers(args):
+    passed = True
+    for stream in (False, True):
+        print(f"限流响应头 ({'流式' if stream else '非流式'}):")
+        server = StubOpenAIServer(rate_limit=args.rate_limit, rate_window=args.rate_window)
+        await server.start()
+        try:
+            with tempfile.TemporaryDirectory(prefix="scam_resilience_") as workdir:
+                manager = DialogueManager(*write_fixtures(workdir, server.base_url, {}, stream=stream))
+                try:
+                    await manager.initialize_agents()
+                    for _ in range(args.rate_turns):
+                        await manager.agent_speak("agent")
+                    stats = server.stats()
+                    guard = manager.endpoint_guards.guard(server.base_url, "stub").stats()
+                    print(f"  请求 {stats['requests']} | 429 {stats['throttled']} | 主动等待 {guard['throttle_waits']}")
+                    passed &= check(stats["throttled"] == 0, f"未收到 429 ({stats['throttled']})")
+                    expected = args.rate_turns // args.rate_limit
+                    passed &= check(guard["throttle_waits"] >= expected,
+                                    f"额度用尽时根据成功响应头主动等待 ({guard['throttle_waits']} >= {expected})")
+                finally:
+                    await manager.shutdown()
+        finally:
+            await server.stop()
+    return passed
+
+
+async def run(args):
+    passed = await check_same_endpoint_fallback(args)
+    passed &= await check_rate_limit_headers(args)
+    return passed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="重试、熔断与备用模型检查")
+    parser.add_argument("--turns", type=int, default=3, help="备用模型检查的发言轮数")
+    parser.add_argument("--rate-turns", type=int, default=12, help="限流检查的发言轮数")
+    parser.add_argument("--rate-limit", type=int, default=4, help="桩服务每个窗口允许的请求数")
+    parser.add_argument("--rate-window", type=float, default=0.5, help="桩服务限流窗口秒数")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    ok = asyncio.run(run(parse_args()))
+    print("通过" if ok else "失败")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,240 @@
+"""
+端到端基准套件：在本地桩服务（stub_openai.py / stub_mcp.py）上驱动 DialogueManager 与 ScamAgent，
+测量启动耗时（冷/热工具缓存）、自动对话吞吐（轮/秒，流式与非流式）、每轮内存增量、
+HTTP 连接复用情况，以及上下文构建耗时随历史长度的变化。结果保存为 JSON，便于前后对比。
+
+用法:
+  python benchmarks/run_suite.py [--turns 100] [--agents 4] [--latency 0.02] [--tool-call-rate 0.2]
+                                 [--no-mcp] [--output 结果.json] [--compare 上次结果.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from core.manager import DialogueManager
+from core.metrics import percentile
+
+from bench_context import fake_entry, make_agents, timed
+from stub_openai import StubOpenAIServer
+
+
+def write_fixtures(workdir, base_url, args, stream):
+    """生成基准用的 config.json / user.json，返回两者路径"""
+    registry = {}
+    if not args.no_mcp:
+        registry["stub"] = {
+            "command": sys.executable,
+            "args": [os.path.join(BENCH_DIR, "stub_mcp.py")],
+            "transport": "stdio",
+            "env": {"STUB_MCP_LATENCY": str(args.tool_latency)},
+        }
+    config = {
+        "max_rounds": -1,
+        "debug_mode": False,
+        "stream": stream,
+        "scheduler": {"policy": "round_robin"},
+        "journal": {"enabled": False},
+        "http": {"http2": False, "max_retries": 0},
+        "tool_schema_cache": os.path.join(workdir, "tool_schemas"),
+        "replay": {"mode": "passthrough", "dir": os.path.join(workdir, "replay")},
+        "mcp_registry": registry,
+    }
+    users = [
+        {
+            "id": f"agent_{i:02d}",
+            "name": f"角色{i}",
+            "system_prompt": "你正在参与一次角色扮演模拟。",
+            "api_key": "bench",
+            "base_url": base_url,
+            "model": "stub",
+            "mcp_servers": [] if args.no_mcp else ["stub"],
+        }
+        for i in range(args.agents)
+    ]
+    config_path = os.path.join(workdir, f"config_{'stream' if stream else 'plain'}.json")
+    user_path = os.path.join(workdir, "user.json")
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    with open(user_path, 'w', encoding='utf-8') as f:
+        json.dump(users, f, ensure_ascii=False, indent=2)
+    return config_path, user_path
+
+
+async def bench_startup(workdir, base_url, args):
+    """冷启动（无工具定义缓存）与热启动（命中磁盘缓存）的 initialize_agents 耗时"""
+    config_path, user_path = write_fixtures(workdir, base_url, args, stream=False)
+    shutil.rmtree(os.path.join(workdir, "tool_schemas"), ignore_errors=True)
+    results = {}
+    for label in ("cold", "warm"):
+        manager = DialogueManager(config_path, user_path)
+        try:
+            results[label] = await manager.initialize_agents()
+        finally:
+            await manager.shutdown()
+    return results
+
+
+async def bench_throughput(workdir, server, args, stream):
+    """自动对话 args.turns 轮，统计吞吐、每轮延迟、内存增量与连接复用"""
+    config_path, user_path = write_fixtures(workdir, server.base_url, args, stream)
+    manager = DialogueManager(config_path, user_path)
+    try:
+        await manager.initialize_agents()
+        # 预热一轮，排除首次建连与导入开销
+        await manager.run_auto(1)
+        before = server.stats()
+        tracemalloc.start()
+        mem_before, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        await manager.run_auto(args.turns)
+        elapsed = time.perf_counter() - start
+        mem_after, mem_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        after = server.stats()
+
+        metrics = [msg["metrics"] for msg in list(manager.global_history)[1:] if msg.get("metrics")]
+        latency = [m["total"] for m in metrics]
+        ttft = [m.get("ttft", m["total"]) for m in metrics]
+        build = [m.get("build_context", 0.0) for m in metrics]
+        requests = after["requests"] - before["requests"]
+        return {
+            "turns": args.turns,
+            "elapsed": round(elapsed, 4),
+            "turns_per_sec": round(args.turns / elapsed, 2) if elapsed else None,
+            "latency": {"p50": percentile(latency, 50), "p95": percentile(latency, 95)},
+            "ttft": {"p50": percentile(ttft, 50), "p95": percentile(ttft, 95)},
+            "build_context": {"p50": percentile(build, 50), "p95": percentile(build, 95)},
+            "tool_calls": sum(len(m.get("tool_calls", [])) for m in metrics),
+            "model_requests": requests,
+            "new_connections": after["connections"] - before["connections"],
+            "memory_per_turn_bytes": round((mem_after - mem_before) / args.turns),
+            "memory_peak_bytes": mem_peak,
+        }
+    finally:
+        await manager.shutdown()
+
+
+def bench_context_build(total, step):
+    """上下文构建耗时 vs 历史长度（全量重建与增量缓存），不经过网络"""
+    agents = make_agents()
+    history = []
+    rows = []
+    for turn in range(total):
+        speaker = agents[turn % len(agents)]
+        speaker._build_context(history)
+        history.append(fake_entry(speaker, turn))
+        if (turn + 1) % step == 0:
+            probe = agents[(turn + 1) % len(agents)]
+
+            def full():
+                probe.invalidate_context()
+                probe._build_context(history)
+
+            full_ms = timed(full) * 1000
+            probe._build_context(history)
+            incremental_ms = timed(lambda: probe._build_context(history)) * 1000
+            rows.append({"history": len(history), "full_ms": round(full_ms, 4),
+                         "incremental_ms": round(incremental_ms, 4)})
+    return rows
+
+
+async def run(args):
+    server = StubOpenAIServer(latency=args.latency, token_rate=args.token_rate,
+                              reply_tokens=args.reply_tokens, tool_call_rate=args.tool_call_rate)
+    await server.start()
+    workdir = tempfile.mkdtemp(prefix="scam_bench_")
+    try:
+        results = {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "params": vars(args),
+            "startup": await bench_startup(workdir, server.base_url, args),
+            "throughput": {
+                "non_stream": await bench_throughput(workdir, server, args, stream=False),
+                "stream": await bench_throughput(workdir, server, args, stream=True),
+            },
+            "context_build": bench_context_build(args.context_turns, args.context_step),
+        }
+    finally:
+        await server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def print_report(results, previous=None):
+    def delta(path):
+        if not previous:
+            return ""
+        old, new = previous, results
+        for key in path:
+            old = (old or {}).get(key) if isinstance(old, dict) else None
+            new = new.get(key)
+        if not old or new is None:
+            return ""
+        return f" ({(new - old) / old:+.1%})"
+
+    print("\n启动耗时 (s):")
+    for label, report in results["startup"].items():
+        print(f"  {label:5} | 构造 {report['construct_agents']:.3f} | 工具 {report['init_tools']:.3f} | "
+              f"合计 {report['total']:.3f}{delta(('startup', label, 'total'))}")
+
+    print("\n自动对话吞吐:")
+    for label, stats in results["throughput"].items():
+        print(f"  {label:10} | {stats['turns_per_sec']} 轮/s{delta(('throughput', label, 'turns_per_sec'))} | "
+              f"延迟 p50 {stats['latency']['p50'] or 0:.4f}s p95 {stats['latency']['p95'] or 0:.4f}s | "
+              f"工具调用 {stats['tool_calls']} | 请求 {stats['model_requests']} / 新连接 {stats['new_connections']} | "
+              f"内存 {stats['memory_per_turn_bytes']} B/轮{delta(('throughput', label, 'memory_per_turn_bytes'))}")
+
+    print("\n上下文构建 (ms):")
+    print(f"  {'历史长度':>8} | {'全量重建':>10} | {'增量缓存':>10}")
+    for row in results["context_build"]:
+        print(f"  {row['history']:>8} | {row['full_ms']:>10.3f} | {row['incremental_ms']:>10.3f}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="端到端基准套件（本地桩服务）")
+    parser.add_argument("--turns", type=int, default=100, help="吞吐测试的自动对话轮数")
+    parser.add_argument("--agents", type=int, default=4, help="角色数量")
+    parser.add_argument("--latency", type=float, default=0.0, help="桩模型每次请求的延迟 (s)")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="桩模型每秒输出 token 数，0 为不限速")
+    parser.add_argument("--reply-tokens", type=int, default=24, help="每条回复的 token 数")
+    parser.add_argument("--tool-call-rate", type=float, default=0.2, help="桩模型发出工具调用的概率")
+    parser.add_argument("--tool-latency", type=float, default=0.0, help="桩 MCP 工具的执行延迟 (s)")
+    parser.add_argument("--no-mcp", action="store_true", help="不挂载桩 MCP 服务")
+    parser.add_argument("--context-turns", type=int, default=2000, help="上下文构建测试的历史长度")
+    parser.add_argument("--context-step", type=int, default=500, help="上下文构建测试的采样间隔")
+    parser.add_argument("--output", help="结果 JSON 路径，默认 benchmarks/results/<时间>.json")
+    parser.add_argument("--compare", help="与之前保存的结果 JSON 对比")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = asyncio.run(run(args))
+
+    previous = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+    print_report(results, previous)
+
+    output = args.output or os.path.join(BENCH_DIR, "results", datetime.now().strftime("%Y%m%d_%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+本地 stdio MCP 桩服务器，提供几个无副作用的查询工具，供基准测试挂载。
+
+环境变量 STUB_MCP_LATENCY 设置每次工具调用的模拟耗时（秒）。
+用法（config.json）: {"command": "python", "args": ["benchmarks/stub_mcp.py"], "transport": "stdio"}
+"""
+import asyncio
+import os
+
+from mcp.server.fastmcp import FastMCP
+
+LATENCY = float(os.environ.get("STUB_MCP_LATENCY", "0"))
+
+mcp = FastMCP("stub")
+
+
+@mcp.tool()
+async def query_balance(account: str = "6222000000000000") -> str:
+    """查询银行账户余额"""
+    if LATENCY:
+        await asyncio.sleep(LATENCY)
+    return f"账户 {account[-4:]} 余额: 12000.00 元"
+
+
+@mcp.tool()
+async def lookup_script(topic: str = "安全账户") -> str:
+    """检索话术脚本"""
+    if LATENCY:
+        await asyncio.sleep(LATENCY)
+    return f"关于「{topic}」的话术：先建立信任，再制造紧迫感。"
+
+
+@mcp.tool()
+async def echo(text: str = "") -> str:
+    """原样返回输入"""
+    return text
+
+
+if __name__ == "__main__":
+    mcp.run(transport="stdio")
@@ -0,0 +1,247 @@
+"""
+本地 OpenAI 兼容桩服务器（仅依赖标准库），用于离线压测与基准测试。
+
+支持 POST /v1/chat/completions（普通与 stream=True 的 SSE 流式响应）、按概率发出 tool_calls、
+指定模型始终返回 503（用于验证重试、熔断与备用模型）、按固定窗口限流并返回 x-ratelimit-* 响应头，
+以及 GET /stats 返回累计的 TCP 连接数、当前打开的连接数与请求数，用于验证连接复用与连接池关闭。
+
+用法: python benchmarks/stub_openai.py --port 8765 --latency 0.05 --token-rate 200 --tool-call-rate 0.3
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+STATUS_TEXT = {200: "OK", 404: "Not Found", 429: "Too Many Requests", 503: "Service Unavailable"}
+REPLY_TOKENS = ["好的", "，", "我", "明白", "了", "。", "请", "稍等", "一下", "，", "马上", "处理", "。"]
+
+
+class StubOpenAIServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, token_rate=0.0, reply_tokens=24,
+                 tool_call_rate=0.0, seed=0, failing_models=(), rate_limit=0, rate_window=1.0):
+        """
+        latency:        每个请求返回首字节前的等待秒数
+        token_rate:     每秒输出 token 数，0 表示不限速
+        reply_tokens:   每条回复的 token 数
+        tool_call_rate: 请求带 tools 且上一条不是工具结果时，发出 tool_calls 的概率
+        failing_models: 这些模型的请求始终返回 503
+        rate_limit:     每 rate_window 秒允许的请求数，超出返回 429；0 表示不限流
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.token_rate = token_rate
+        self.reply_tokens = reply_tokens
+        self.tool_call_rate = tool_call_rate
+        self.rng = random.Random(seed)
+        self.failing_models = set(failing_models)
+        # 按模型统计的请求数（含失败的请求）
+        self.model_requests = {}
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.throttled = 0
+        self._window_start = 0.0
+        self._window_count = 0
+        self.connections = 0
+        self.open_connections = 0
+        self.requests = 0
+        self._server = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.base_url
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def stats(self):
+        return {"connections": self.connections, "open": self.open_connections, "requests": self.requests,
+                "throttled": self.throttled}
+
+    async def _handle_connection(self, reader, writer):
+        self.connections += 1
+        self.open_connections += 1
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, body = request
+                self.requests += 1
+                if method == "GET" and path.rstrip("/") == "/stats":
+                    await self._send_json(writer, self.stats())
+                elif method == "POST" and path.rstrip("/").endswith("/chat/completions"):
+                    await self._chat_completions(writer, json.loads(body or b"{}"))
+                else:
+                    await self._send_json(writer, {"error": {"message": f"not found: {path}"}}, status=404)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.open_connections -= 1
+            writer.close()
+
+    async def _read_request(self, reader):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return None
+        lines = head.decode("latin-1").split("\r\n")
+        method, path, _ = lines[0].split(" ", 2)
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                key, value = line.split(":", 1)
+                headers[key.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0))
+        body = await reader.readexactly(length) if length else b""
+        return method, path, body
+
+    async def _send_json(self, writer, payload, status=200, headers=""):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, 'Error')}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: keep-alive\r\n{headers}\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+
+    def _take_rate_limit(self):
+        """固定窗口计数，返回 (是否放行, 附加响应头)；与 OpenAI 一样，成功响应也带剩余额度与重置时间"""
+        if not self.rate_limit:
+            return True, ""
+        now = time.monotonic()
+        if now - self._window_start >= self.rate_window:
+            self._window_start = now
+            self._window_count = 0
+        reset = self._window_start + self.rate_window - now
+        if self._window_count >= self.rate_limit:
+            self.throttled += 1
+            return False, f"retry-after-ms: {int(reset * 1000)}\r\n"
+        self._window_count += 1
+        return True, (f"x-ratelimit-limit-requests: {self.rate_limit}\r\n"
+                      f"x-ratelimit-remaining-requests: {self.rate_limit - self._window_count}\r\n"
+                      f"x-ratelimit-reset-requests: {reset:.3f}s\r\n")
+
+    def _plan_reply(self, request):
+        """决定本次回复：文本或一次工具调用"""
+        tools = request.get("tools") or []
+        messages = request.get("messages") or []
+        last_role = messages[-1].get("role") if messages else None
+        if tools and last_role != "tool" and self.rng.random() < self.tool_call_rate:
+            tool = self.rng.choice(tools)["function"]["name"]
+            return None, [{"id": f"call_{uuid.uuid4().hex[:12]}", "type": "function",
+                           "function": {"name": tool, "arguments": "{}"}}]
+        tokens = [REPLY_TOKENS[i % len(REPLY_TOKENS)] for i in range(self.reply_tokens)]
+        return tokens, None
+
+    async def _chat_completions(self, writer, request):
+        allowed, rate_headers = self._take_rate_limit()
+        if not allowed:
+            await self._send_json(writer, {"error": {"message": "rate limit exceeded", "type": "requests"}},
+                                  status=429, headers=rate_headers)
+            return
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        model = request.get("model", "stub")
+        self.model_requests[model] = self.model_requests.get(model, 0) + 1
+        if model in self.failing_models:
+            await self._send_json(writer, {"error": {"message": f"{model} unavailable", "type": "server_error"}},
+                                  status=503)
+            return
+        tokens, tool_calls = self._plan_reply(request)
+        prompt_tokens = len(json.dumps(request.get("messages", []), ensure_ascii=False)) // 4
+        completion_tokens = len(tokens) if tokens else 8
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        if not request.get("stream"):
+            if tokens and self.token_rate:
+                await asyncio.sleep(len(tokens) / self.token_rate)
+            message = {"role": "assistant", "content": "".join(tokens) if tokens else None}
+            if tool_calls:
+                message["tool_calls"] = tool_calls
+            await self._send_json(writer, {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_calls else "stop"}],
+                "usage": usage,
+            }, headers=rate_headers)
+            return
+
+        writer.write(("HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                      f"Transfer-Encoding: chunked\r\nConnection: keep-alive\r\n{rate_headers}\r\n").encode("latin-1"))
+
+        async def send_event(payload):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+            await writer.drain()
+
+        def chunk(delta, finish_reason=None):
+            return json.dumps({
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }, ensure_ascii=False)
+
+        if tool_calls:
+            for i, call in enumerate(tool_calls):
+                # 与真实服务一致：先发 id/name，再分片发送 arguments
+                await send_event(chunk({"role": "assistant", "tool_calls": [
+                    {"index": i, "id": call["id"], "type": "function",
+                     "function": {"name": call["function"]["name"], "arguments": ""}}]}))
+                await send_event(chunk({"tool_calls": [
+                    {"index": i, "function": {"arguments": call["function"]["arguments"]}}]}))
+            await send_event(chunk({}, "tool_calls"))
+        else:
+            for i, token in enumerate(tokens):
+                if self.token_rate:
+                    await asyncio.sleep(1 / self.token_rate)
+                await send_event(chunk({"role": "assistant", "content": token} if i == 0 else {"content": token}))
+            await send_event(chunk({}, "stop"))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            await send_event(json.dumps({
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [], "usage": usage,
+            }))
+        await send_event("[DONE]")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+async def serve(args):
+    server = StubOpenAIServer(args.host, args.port, args.latency, args.token_rate, args.reply_tokens,
+                              args.tool_call_rate, args.seed, args.fail_model, args.rate_limit, args.rate_window)
+    base_url = await server.start()
+    print(f"Stub OpenAI 服务已启动: {base_url}")
+    await asyncio.Event().wait()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容桩服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--token-rate", type=float, default=0.0)
+    parser.add_argument("--reply-tokens", type=int, default=24)
+    parser.add_argument("--tool-call-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fail-model", action="append", default=[], help="该模型的请求始终返回 503，可重复")
+    parser.add_argument("--rate-limit", type=int, default=0, help="每个窗口允许的请求数，0 表示不限流")
+    parser.add_argument("--rate-window", type=float, default=1.0, help="限流窗口秒数")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(serve(parse_args()))
+    except KeyboardInterrupt:
+        pass
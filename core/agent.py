@@ -1,15 +1,49 @@
+import asyncio
 import json
-from openai import AsyncOpenAI, APIStatusError, APIConnectionError
-from langchain_core.utils.function_calling import convert_to_openai_tool
+import time
+from .http_pool import ClientRegistry
+from .replay import ReplayMissError
+from .resilience import CircuitOpenError, is_retryable
+from .tokens import count_message_tokens, count_tokens, count_tools_tokens
+
+def _usage_dict(usage):
+    """提取 token 用量，部分服务商不返回 usage"""
+    if usage is None:
+        return {}
+    return {
+        "prompt_tokens": usage.prompt_tokens or 0,
+        "completion_tokens": usage.completion_tokens or 0,
+    }
 
 class ScamAgent:
-    def __init__(self, user_data, mcp_client=None, debug_mode=False):
+    def __init__(self, user_data, mcp_client=None, debug_mode=False, request_gate=None, client_registry=None,
+                 replay_cache=None, endpoint_guards=None):
         self.id = user_data["id"]
         self.name = user_data["name"]
         self.system_prompt = user_data["system_prompt"]
         self.debug_mode = debug_mode
         
         self.model_name = user_data.get("model", "gpt-4o")
+        self.base_url = user_data.get("base_url")
+        self.seed = user_data.get("seed")
+        # 加权调度 (scheduler.policy = weighted) 时的发言权重
+        self.weight = user_data.get("weight", 1)
+        # 可选的请求闸门 (core.limits.RequestGate)，用于全局并发与按 base_url 限速
+        self.request_gate = request_gate
+        # 可选的响应回放缓存 (core.replay.ReplayCache)
+        self.replay_cache = replay_cache
+        # 可选的按 (base_url, model) 重试/熔断 (core.resilience.EndpointGuards)
+        self.endpoint_guards = endpoint_guards
+        # 主模型重试耗尽或熔断时切换的备用模型，默认与主模型同一 base_url / api_key
+        self.fallback_model = user_data.get("fallback_model")
+        self.fallback_base_url = user_data.get("fallback_base_url", self.base_url)
+        # 本轮的重试次数与是否使用了备用模型，写入 last_turn_metrics
+        self._turn_retries = 0
+        self._turn_fallbacks = 0
+        # 流式输出开关，由 DialogueManager 根据 config.json 的 stream 设置
+        self.stream = False
+        # 最近一轮的统计信息 (如 ttft)，由 DialogueManager 附加到 message_entry
+        self.last_turn_metrics = {}
         
         # 模拟浏览器指纹
         browser_headers = {
@@ -18,58 +52,128 @@ class ScamAgent:
             "Content-Type": "application/json"
         }
 
-        self.client = AsyncOpenAI(
-            api_key=user_data.get("api_key"),
-            base_url=user_data.get("base_url"),
-            max_retries=2, 
-            timeout=30.0,
-            default_headers=browser_headers
-        )
+        # 相同 base_url / api_key / headers 的角色共享同一个客户端与连接池
+        # 客户端在首次请求时才创建（同时才导入 openai），只浏览历史时不产生开销
+        self.client_registry = client_registry or ClientRegistry()
+        self._api_key = user_data.get("api_key")
+        self._fallback_api_key = user_data.get("fallback_api_key", self._api_key)
+        self._browser_headers = browser_headers
+        self._client = None
+        self._fallback_client = None
         
         self.mcp_client = mcp_client
         self.tools_map = {}     
         self.openai_tools = [] 
+        # 工具在 init_tools 或首次发言时加载 (ensure_tools)
+        self.tools_loaded = False
+        self._tools_lock = asyncio.Lock()
+
+        # 同一轮内多个工具调用并发执行：并发上限与单个工具超时(秒)
+        max_tool_concurrency = user_data.get("max_tool_concurrency", 4)
+        self.tool_semaphore = asyncio.Semaphore(max_tool_concurrency) if max_tool_concurrency else None
+        self.tool_timeout = user_data.get("tool_timeout", 60.0)
+
+        # 上下文 token 预算：超出时将较早的对话折叠为滚动摘要，见 _fit_context
+        self.context_budget = user_data.get("context_budget")
+        self.keep_recent_messages = max(1, user_data.get("keep_recent_messages", 12))
+        self.tool_output_limit = user_data.get("tool_output_limit", 500)
+        # 折叠后的目标占用比例，留出余量避免每轮都重新摘要
+        self.summary_target = user_data.get("summary_target", 0.75)
+        self.summary_model = user_data.get("summary_model", self.model_name)
+
+        # 增量上下文缓存，见 _build_context
+        self.invalidate_context()
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self.client_registry.get_client(self.base_url, self._api_key, self._browser_headers)
+        return self._client
+
+    @property
+    def fallback_client(self):
+        if self._fallback_client is None and self.fallback_model:
+            self._fallback_client = self.client_registry.get_client(
+                self.fallback_base_url, self._fallback_api_key, self._browser_headers
+            )
+        return self._fallback_client
+
+    async def ensure_tools(self):
+        """首次发言前按需加载工具，并发调用只加载一次；有 server 加载失败时，下次发言前重试"""
+        if self.tools_loaded:
+            return
+        async with self._tools_lock:
+            if not self.tools_loaded:
+                await self.init_tools()
 
     async def init_tools(self):
-        """初始化工具并转换为 OpenAI 格式"""
+        """初始化工具及其 OpenAI 格式定义（定义由 MCPClientManager 转换并在角色间共享）"""
+        loaded = True
         if self.mcp_client:
             try:
-                lc_tools = await self.mcp_client.get_tools()
+                lc_tools, openai_tools = await self.mcp_client.load_tools()
                 
                 if self.debug_mode:
                     print(f"[DEBUG] {self.name}: 正在从 MCP 加载工具... 发现 {len(lc_tools)} 个")
                 
                 self.tools_map = {t.name: t for t in lc_tools}
-                self.openai_tools = []
+                self.openai_tools = openai_tools
                 
-                for t in lc_tools:
-                    try:
-                        tool_def = convert_to_openai_tool(t)
-                        if "type" not in tool_def:
-                            tool_def = {"type": "function", "function": tool_def}
-                        self.openai_tools.append(tool_def)
-                        if self.debug_mode:
-                            print(f"[DEBUG]   -> 已挂载工具: {t.name}")
-                    except Exception as e:
-                        print(f"[WARN] {self.name}: 转换工具 {t.name} 失败: {e}")
+                if self.debug_mode:
+                    for t in lc_tools:
+                        print(f"[DEBUG]   -> 已挂载工具: {t.name}")
+
+                if self.mcp_client.failed_servers:
+                    loaded = False
+                    print(f"[WARN] {self.name}: MCP 服务 {', '.join(self.mcp_client.failed_servers)} "
+                          f"未就绪，下次发言前重试")
 
             except Exception as e:
+                loaded = False
                 print(f"[ERROR] {self.name}: MCP 工具加载失败 (连接错误或 Server 未启动): {e}")
+        self.tools_loaded = loaded
 
-    def _build_context(self, global_history):
-        """构建 OpenAI 格式消息列表，支持私有工具历史回放"""
-        messages = [{"role": "system", "content": self.system_prompt}]
+    def invalidate_context(self, deleted_index=None):
+        """丢弃增量上下文缓存，下次构建时从头回放历史（历史被删除或重新加载时调用）
+        deleted_index 为被删除消息的序号：摘要只覆盖其之前的历史时保留摘要，不必重新生成
+        """
+        keep_summary = (deleted_index is not None and self._summary_text
+                        and self._ctx_history_end[self._summary_upto - 1] <= deleted_index)
+        summary = (self._summary_text, self._summary_upto) if keep_summary else ("", 1)
+        self._ctx_source = None
+        self._ctx_consumed = 0
+        self._ctx_messages = [{"role": "system", "content": self.system_prompt}]
+        # _ctx_messages 中每条消息由 global_history 的前多少条生成
+        self._ctx_history_end = [0]
         # 使用 buffer 将连续的其他人发言合并为一条 User 消息
-        user_buffer = [{"role": "user", "content": f"## system/n/n{self.system_prompt}"}]
+        self._ctx_buffer = [{"role": "user", "content": f"## system/n/n{self.system_prompt}"}]
+        # 与 _ctx_messages 对应的 token 数缓存，以及滚动摘要（覆盖 _ctx_messages[1:_summary_upto]）
+        self._ctx_tokens = []
+        self._summary_text, self._summary_upto = summary
+
+    def _build_context(self, global_history):
+        """构建 OpenAI 格式消息列表，支持私有工具历史回放
+
+        已结算的消息缓存在 self._ctx_messages 中，每次只处理上次之后新增的历史；
+        若历史对象被替换或变短（load / delete），则自动重建。
+        """
+        if global_history is not self._ctx_source or len(global_history) < self._ctx_consumed:
+            # _ctx_source 为 None 时缓存刚被清空（可能保留了摘要），无需再次清空
+            if self._ctx_source is not None:
+                self.invalidate_context()
+            self._ctx_source = global_history
 
-        for msg in global_history:
+        messages = self._ctx_messages
+        history_end = self._ctx_history_end
+        for i in range(self._ctx_consumed, len(global_history)):
+            msg = global_history[i]
             # 如果是当前 Agent 自己的历史
             if msg['role_id'] == self.id:
                 # 1. 先把缓冲区里的“他人发言”结算并加入
-                if user_buffer:
-                    content_json = json.dumps(user_buffer, ensure_ascii=False)
+                if self._ctx_buffer:
+                    content_json = json.dumps(self._ctx_buffer, ensure_ascii=False)
                     messages.append({"role": "user", "content": content_json})
-                    user_buffer = [] 
+                    self._ctx_buffer = []
 
                 # 2. 回放私有的思维链 (internal_thoughts)
                 # 这些是工具调用请求(assistant)和工具结果(tool)
@@ -78,24 +182,325 @@ class ScamAgent:
 
                 # 3. 加入最终对外的回复 (assistant)
                 messages.append({"role": "assistant", "content": msg['content']})
+                history_end.extend([i + 1] * (len(messages) - len(history_end)))
 
             else:
                 # 如果是其他人的历史，只看 content，忽略他们的 internal_thoughts
-                user_buffer.append({msg['role_name']: msg['content']})
+                self._ctx_buffer.append({msg['role_name']: msg['content']})
+        self._ctx_consumed = len(global_history)
+
+        # 返回副本，ReAct 循环会向其中追加本轮消息，不能污染缓存
+        result = list(messages)
+        # 处理最后剩余的 buffer（不结算进缓存，下一轮可能还会继续追加）
+        if self._ctx_buffer:
+            content_json = json.dumps(self._ctx_buffer, ensure_ascii=False)
+            result.append({"role": "user", "content": content_json})
+
+        return result
+
+    def _truncate_tool_output(self, message):
+        content = message.get("content") or ""
+        if message.get("role") != "tool" or len(content) <= self.tool_output_limit:
+            return message
+        truncated = dict(message)
+        truncated["content"] = content[:self.tool_output_limit] + f"...(已截断，原长 {len(content)} 字符)"
+        return truncated
+
+    def _render_for_summary(self, messages):
+        lines = []
+        for m in messages:
+            m = self._truncate_tool_output(m)
+            if m.get("tool_calls"):
+                calls = ", ".join(f"{tc['function']['name']}({tc['function']['arguments']})" for tc in m["tool_calls"])
+                lines.append(f"[{m['role']}] 调用工具: {calls}")
+            if m.get("content"):
+                lines.append(f"[{m['role']}] {m['content']}")
+        return "\n".join(lines)
+
+    async def _extend_summary(self, folded):
+        """把新折叠的消息并入已有摘要（增量，只发送新增部分）"""
+        prompt = (
+            f"你是{self.name}的记忆助手。请把【已有摘要】与【新增对话】合并成一份简洁的中文摘要，"
+            "保留人物、关键事实、金额、承诺、工具查询结果和尚未解决的问题，不要编造。\n\n"
+            f"【已有摘要】\n{self._summary_text or '（无）'}\n\n"
+            f"【新增对话】\n{self._render_for_summary(folded)}"
+        )
+        content = await self.complete([{"role": "user", "content": prompt}], model=self.summary_model)
+        return content or self._summary_text
+
+    def _summary_chunk_end(self, messages, start, fold_to):
+        """
+        一次摘要请求折叠 messages[start:end]：新增对话的 token 数不超过预算中摘要之外的余量，
+        至少一条，且 end 不落在 tool 消息上（下次的上下文窗口从 end 开始）
+        """
+        limit = max(self.context_budget // 4,
+                    int(self.context_budget * self.summary_target) - count_tokens(self._summary_text))
+        used = 0
+        end = start
+        while end < fold_to:
+            size = count_tokens(self._render_for_summary([messages[end]]))
+            if end > start and used + size > limit and messages[end].get("role") != "tool":
+                break
+            used += size
+            end += 1
+        return end
+
+    async def complete(self, messages, model=None):
+        """不带工具的单次补全，返回文本；用于摘要、发言调度等辅助请求"""
+        message, _ = await self._request_model({
+            "model": model or self.model_name,
+            "messages": messages,
+        })
+        return message.get("content") or ""
+
+    async def _fit_context(self, messages):
+        """
+        按 context_budget 裁剪上下文：
+        最近 keep_recent_messages 条保持原样，更早的工具输出截断，
+        仍超出预算时把最早的消息折叠进滚动摘要。摘要结果缓存复用，折叠点只向前推进。
+        需要折叠的消息较多时（如加载长历史后）分批请求，每批的大小受预算限制。
+        """
+        settled = self._ctx_messages
+        while len(self._ctx_tokens) < len(settled):
+            self._ctx_tokens.append(count_message_tokens(settled[len(self._ctx_tokens)]))
+        tail_tokens = [count_message_tokens(m) for m in messages[len(settled):]]
+
+        def tokens_at(i):
+            return self._ctx_tokens[i] if i < len(settled) else tail_tokens[i - len(settled)]
+
+        n = len(messages)
+        # 最近区域的起点不能落在 tool 消息上，否则会与其 tool_calls 请求分离
+        recent_start = max(1, n - self.keep_recent_messages)
+        while recent_start > 1 and messages[recent_start].get("role") == "tool":
+            recent_start -= 1
+
+        def window(start):
+            return [
+                self._truncate_tool_output(messages[i]) if i < recent_start else messages[i]
+                for i in range(start, n)
+            ]
+
+        def cost(i):
+            if i < recent_start and messages[i].get("role") == "tool":
+                return count_message_tokens(self._truncate_tool_output(messages[i]))
+            return tokens_at(i)
+
+        fixed = tokens_at(0) + count_tools_tokens(self.openai_tools)
+        start = min(self._summary_upto, recent_start)
+        summary_tokens = count_message_tokens({"content": self._summary_text}) if self._summary_text else 0
+        total = fixed + summary_tokens + sum(cost(i) for i in range(start, n))
+
+        if total > self.context_budget and start < recent_start:
+            # 折叠到目标占用以下，并停在安全边界(非 tool 消息)
+            target = self.context_budget * self.summary_target
+            fold_to = start
+            remaining = total
+            while fold_to < recent_start and (remaining > target or messages[fold_to].get("role") == "tool"):
+                remaining -= cost(fold_to)
+                fold_to += 1
+            try:
+                # 每批成功后即推进折叠点，中途失败时已完成的批次不会重做
+                while start < fold_to:
+                    end = self._summary_chunk_end(messages, start, fold_to)
+                    self._summary_text = await self._extend_summary(messages[start:end])
+                    self._summary_upto = end
+                    start = end
+                if self.debug_mode:
+                    print(f"[DEBUG] {self.name}: 已将 {fold_to - 1} 条早期消息折叠为摘要")
+            except Exception as e:
+                print(f"[WARN] {self.name}: 生成摘要失败，本轮发送未折叠部分的完整上下文: {e}")
+
+        result = [messages[0]]
+        if self._summary_text:
+            result.append({"role": "system", "content": f"以下是更早对话的摘要：\n{self._summary_text}"})
+        result.extend(window(start))
+        return result
+
+    async def _run_tool_call(self, tool_call, tool_stats=None):
+        """执行单个工具调用，受并发上限和超时约束，异常均转为 Error 文本
+        tool_stats 不为 None 时追加本次调用的耗时记录
+        """
+        func_name = tool_call["function"]["name"]
+        func_args_str = tool_call["function"]["arguments"]
+        call_id = tool_call["id"]
+
+        if self.debug_mode:
+            print(f"[DEBUG] 执行: {func_name} | 参数: {func_args_str}")
+
+        content_result = ""
+        ok = False
+        start = time.perf_counter()
+        if func_name in self.tools_map:
+            try:
+                args = json.loads(func_args_str)
+                if self.tool_semaphore:
+                    async with self.tool_semaphore:
+                        observation = await self._invoke_tool(func_name, args)
+                else:
+                    observation = await self._invoke_tool(func_name, args)
+                content_result = str(observation)
+                ok = True
+            except asyncio.TimeoutError:
+                content_result = f"Error: Tool {func_name} timed out after {self.tool_timeout}s."
+            except Exception as e:
+                content_result = f"Error: {str(e)}"
+        else:
+            content_result = f"Error: Tool {func_name} not found."
+
+        if tool_stats is not None:
+            tool_stats.append({"name": func_name, "latency": round(time.perf_counter() - start, 3), "ok": ok})
+
+        # 构建工具返回消息
+        return {
+            "role": "tool",
+            "tool_call_id": call_id,
+            "name": func_name,
+            "content": content_result
+        }
+
+    async def _invoke_tool(self, func_name, args):
+        coro = self.tools_map[func_name].ainvoke(args)
+        if self.tool_timeout:
+            return await asyncio.wait_for(coro, timeout=self.tool_timeout)
+        return await coro
+
+    async def _request_model(self, request_kwargs, on_delta=None):
+        """发起一次模型请求，返回 (可序列化的 assistant 消息 dict, usage dict)"""
+        replay = self.replay_cache
+        if replay and replay.enabled:
+            key = replay.make_key(request_kwargs)
+            if replay.mode == "replay":
+                record = replay.get(key)
+                if record is None:
+                    raise ReplayMissError(f"{self.name}: 回放缓存未命中 (key={key[:12]})")
+                message = record["message"]
+                if on_delta and message.get("content"):
+                    on_delta(message["content"])
+                return message, record.get("usage", {})
+            message, usage = await self._call_model(request_kwargs, on_delta)
+            replay.put(key, message, usage)
+            return message, usage
+        return await self._call_model(request_kwargs, on_delta)
+
+    async def _call_model(self, request_kwargs, on_delta):
+        """请求主模型，重试耗尽或熔断时切换到备用模型 (user.json 的 fallback_model)
+        重试发生在单次模型往返内部，失败的请求不会写入上下文或 internal_thoughts
+        """
+        try:
+            # 有备用模型时主模型熔断立即切换，否则等待端点恢复
+            return await self._guarded_request(self.client, self.base_url, request_kwargs, on_delta,
+                                               fail_fast=bool(self.fallback_model))
+        except Exception as e:
+            if not self.fallback_model or not (isinstance(e, CircuitOpenError) or is_retryable(e)):
+                raise
+            print(f"\n[WARN] {self.name}: {self.model_name} 不可用 ({e})，切换到备用模型 {self.fallback_model}")
+            self._turn_fallbacks += 1
+            fallback_kwargs = dict(request_kwargs, model=self.fallback_model)
+            return await self._guarded_request(self.fallback_client, self.fallback_base_url, fallback_kwargs,
+                                               on_delta)
+
+    async def _guarded_request(self, client, base_url, request_kwargs, on_delta, fail_fast=False):
+        if not (self.endpoint_guards and self.endpoint_guards.enabled):
+            return await self._gated_request(client, base_url, request_kwargs, on_delta)
 
-        # 处理最后剩余的 buffer
-        if user_buffer:
-            content_json = json.dumps(user_buffer, ensure_ascii=False)
-            messages.append({"role": "user", "content": content_json})
-            
-        return messages
+        def on_retry(attempt, error, delay):
+            self._turn_retries += 1
+            print(f"\n[WARN] {self.name}: 请求 {base_url} 失败 ({type(error).__name__}: {error})，"
+                  f"{delay:.1f}s 后第 {attempt} 次重试")
+
+        # 熔断按 (base_url, model) 区分：同一端点上的备用模型不受主模型熔断影响
+        guard = self.endpoint_guards.guard(base_url, request_kwargs["model"])
+        return await guard.call(
+            lambda: self._gated_request(client, base_url, request_kwargs, on_delta, on_headers=guard.observe),
+            fail_fast=fail_fast,
+            on_retry=on_retry,
+        )
+
+    async def _gated_request(self, client, base_url, request_kwargs, on_delta, on_headers=None):
+        if self.request_gate:
+            async with self.request_gate.slot(base_url):
+                return await self._send_request(client, request_kwargs, on_delta, on_headers)
+        return await self._send_request(client, request_kwargs, on_delta, on_headers)
+
+    async def _send_request(self, client, request_kwargs, on_delta, on_headers=None):
+        """on_headers(headers) 接收成功响应的响应头（用于读取 x-ratelimit-*）"""
+        completions = client.chat.completions.with_raw_response if on_headers else client.chat.completions
+        if not self.stream:
+            response = await completions.create(**request_kwargs)
+            if on_headers:
+                on_headers(response.headers)
+                response = response.parse()
+            # 将 OpenAI 对象转为可序列化的 dict，用于上下文与历史存储
+            message = response.choices[0].message.model_dump(exclude_none=True)
+            return message, _usage_dict(response.usage)
+
+        stream = await completions.create(
+            **request_kwargs, stream=True, stream_options={"include_usage": True}
+        )
+        if on_headers:
+            on_headers(stream.headers)
+            stream = stream.parse()
+        usage = {}
+        content_parts = []
+        # 流式 tool_calls 以分片形式到达，按 index 拼接 id / name / arguments
+        tool_calls = {}
+        async for chunk in stream:
+            # include_usage 时最后一个分片只携带 usage，choices 为空
+            if getattr(chunk, "usage", None):
+                usage = _usage_dict(chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content_parts.append(delta.content)
+                if on_delta:
+                    on_delta(delta.content)
+            for tc in delta.tool_calls or []:
+                entry = tool_calls.setdefault(tc.index, {
+                    "id": "", "type": "function", "function": {"name": "", "arguments": ""}
+                })
+                if tc.id:
+                    entry["id"] = tc.id
+                if tc.function:
+                    if tc.function.name:
+                        entry["function"]["name"] += tc.function.name
+                    if tc.function.arguments:
+                        entry["function"]["arguments"] += tc.function.arguments
+
+        message = {"role": "assistant"}
+        if content_parts:
+            message["content"] = "".join(content_parts)
+        if tool_calls:
+            message["tool_calls"] = [tool_calls[i] for i in sorted(tool_calls)]
+        return message, usage
+
+    async def generate_response(self, global_history, on_delta=None):
+        """执行 ReAct 循环，返回 (final_text, tool_logs)
+        流式模式下最终回复的文本片段会逐块回调 on_delta(text)
+        """
+        await self.ensure_tools()
+        turn_start = time.perf_counter()
+        first_token_at = None
+        self._turn_retries = 0
+        self._turn_fallbacks = 0
+
+        def handle_delta(text):
+            nonlocal first_token_at
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            if on_delta:
+                on_delta(text)
 
-    async def generate_response(self, global_history):
-        """执行 ReAct 循环，返回 (final_text, tool_logs)"""
         current_messages = self._build_context(global_history)
+        if self.context_budget:
+            current_messages = await self._fit_context(current_messages)
+        build_context_time = time.perf_counter() - turn_start
         
         # 用于记录本轮对话中产生的所有“非最终回复”的消息（即工具调用和工具结果）
         turn_internal_thoughts = []
+        # 本轮每次模型往返与工具调用的统计
+        model_stats = []
+        tool_stats = []
 
         if self.debug_mode:
             print(f"\n[DEBUG] {self.name} 正在请求模型: {self.model_name}")
@@ -110,73 +515,74 @@ class ScamAgent:
                 if self.openai_tools:
                     request_kwargs["tools"] = self.openai_tools
                     request_kwargs["tool_choice"] = "auto"
+                if self.seed is not None:
+                    request_kwargs["seed"] = self.seed
                 if self.debug_mode:
                     print("[DEBUG] >>> 正在请求模型: {self.model_name}")
                     print("[DEBUG] >>> 请求参数:")
                     print(request_kwargs)
                 # 发起请求
-                response = await self.client.chat.completions.create(**request_kwargs)
-                response_msg = response.choices[0].message
-                
-                # 将 OpenAI 对象转为可序列化的 dict，用于历史存储
-                response_msg_dict = response_msg.model_dump(exclude_none=True)
+                request_start = time.perf_counter()
+                response_msg_dict, usage = await self._request_model(request_kwargs, handle_delta)
+                model_stats.append({
+                    "latency": round(time.perf_counter() - request_start, 3),
+                    "prompt_tokens": usage.get("prompt_tokens", 0),
+                    "completion_tokens": usage.get("completion_tokens", 0),
+                })
 
                 # 处理工具调用
-                if response_msg.tool_calls:
+                if response_msg_dict.get("tool_calls"):
                     # 1. 将模型的调用指令加入上下文和本轮日志
-                    current_messages.append(response_msg) # 对象用于继续 API 调用
-                    turn_internal_thoughts.append(response_msg_dict) # 字典用于存储
+                    current_messages.append(response_msg_dict)
+                    turn_internal_thoughts.append(response_msg_dict)
 
                     if self.debug_mode:
-                        print(f"[DEBUG] >>> 模型触发工具调用: {len(response_msg.tool_calls)} 个")
+                        print(f"[DEBUG] >>> 模型触发工具调用: {len(response_msg_dict['tool_calls'])} 个")
                     
-                    for tool_call in response_msg.tool_calls:
-                        func_name = tool_call.function.name
-                        func_args_str = tool_call.function.arguments
-                        call_id = tool_call.id
-                        
-                        if self.debug_mode:
-                            print(f"[DEBUG] 执行: {func_name} | 参数: {func_args_str}")
-                        
-                        content_result = ""
-                        if func_name in self.tools_map:
-                            try:
-                                args = json.loads(func_args_str)
-                                observation = await self.tools_map[func_name].ainvoke(args)
-                                content_result = str(observation)
-                            except Exception as e:
-                                content_result = f"Error: {str(e)}"
-                        else:
-                            content_result = f"Error: Tool {func_name} not found."
-
-                        # 构建工具返回消息
-                        tool_msg = {
-                            "role": "tool",
-                            "tool_call_id": call_id,
-                            "name": func_name,
-                            "content": content_result
-                        }
-                        
-                        # 2. 将工具结果加入上下文和本轮日志
-                        current_messages.append(tool_msg)
-                        turn_internal_thoughts.append(tool_msg)
+                    # 2. 并发执行所有工具调用，gather 保证结果顺序与 tool_calls 一致
+                    tool_msgs = await asyncio.gather(
+                        *(self._run_tool_call(tool_call, tool_stats) for tool_call in response_msg_dict["tool_calls"])
+                    )
+
+                    # 3. 将工具结果加入上下文和本轮日志
+                    current_messages.extend(tool_msgs)
+                    turn_internal_thoughts.extend(tool_msgs)
 
                     continue # 拿着工具结果继续循环
                 
                 else:
                     # 最终回复
-                    content = response_msg.content
+                    content = response_msg_dict.get("content")
                     if self.debug_mode:
                         print(f"[DEBUG] 模型最终回复: {content}")
+
+                    # 非流式模式下，首个 token 即整条回复到达的时刻
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    self.last_turn_metrics = {
+                        "stream": self.stream,
+                        "total": round(time.perf_counter() - turn_start, 3),
+                        "ttft": round(first_token_at - turn_start, 3),
+                        "build_context": round(build_context_time, 3),
+                        "iterations": len(model_stats),
+                        "prompt_tokens": sum(m["prompt_tokens"] for m in model_stats),
+                        "completion_tokens": sum(m["completion_tokens"] for m in model_stats),
+                        "retries": self._turn_retries,
+                        "fallbacks": self._turn_fallbacks,
+                        "model_calls": model_stats,
+                        "tool_calls": tool_stats,
+                    }
                     
                     # 返回：(最终文本, 中间思考过程)
                     return content if content else "", turn_internal_thoughts
 
-            except APIStatusError as e:
-                print(f"\n[API Error] Status: {e.status_code}")
-                if self.debug_mode and e.body:
-                    print(json.dumps(e.body, ensure_ascii=False))
-                raise e
             except Exception as e:
-                print(f"\n[Runtime Error] {e}")
-                raise e
\ No newline at end of file
+                # openai.APIStatusError 带有 status_code（按属性判断，避免在模块加载时导入 openai）
+                status_code = getattr(e, "status_code", None)
+                if status_code is not None:
+                    print(f"\n[API Error] Status: {status_code}")
+                    if self.debug_mode and getattr(e, "body", None):
+                        print(json.dumps(e.body, ensure_ascii=False))
+                else:
+                    print(f"\n[Runtime Error] {e}")
+                raise e
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from .http_pool import ClientRegistry
+from .limits import RequestGate
+from .manager import DialogueManager
+from .resilience import EndpointGuards, http_config_for
+
+
+def load_batch_spec(path):
+    """
+    读取批量运行描述文件，格式:
+    {
+      "output_dir": "history/batch_xxx",      // 可选
+      "rounds": 20,                           // 每个场景默认轮数
+      "max_in_flight": 16,                    // 全局在途模型请求上限
+      "max_conversations": 32,                // 同时运行的对话数上限
+      "rate_limits": {"<base_url>": 60},      // 每分钟请求数
+      "default_rate": null,
+      "http": {"http2": true, "max_connections": 100},  // 共享连接池配置，同 config.json
+      "resilience": {"max_attempts": 5},      // 共享的重试/熔断配置，同 config.json
+      "replay_mode": "replay",                // 可选，覆盖各场景 config.json 的 replay.mode
+      "scenarios": [
+        {"name": "s1", "config": "config.json", "user": "user.json", "rounds": 10, "seed": 1}
+      ]
+    }
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _append_result(output_dir, result):
+    """每个对话结束后立即追加一行结果，中途中断也不会丢失已完成的场景"""
+    with open(os.path.join(output_dir, "results.jsonl"), 'a', encoding='utf-8') as f:
+        f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+async def run_scenario(scenario, request_gate, output_dir, default_rounds=10, debug_mode=False, client_registry=None,
+                       replay_mode=None, endpoint_guards=None):
+    """运行单个场景：独立的 DialogueManager，共享全局请求闸门、HTTP 连接池与端点熔断状态"""
+    name = scenario["name"]
+    start = time.perf_counter()
+    result = {"name": name, "config": scenario.get("config", "config.json"), "user": scenario.get("user", "user.json")}
+    try:
+        manager = DialogueManager(result["config"], result["user"], request_gate=request_gate,
+                                  client_registry=client_registry, endpoint_guards=endpoint_guards)
+    except Exception as e:
+        result.update(status="error", error=f"场景加载失败: {e}", turns=0)
+        _append_result(output_dir, result)
+        return result
+
+    manager.config["debug_mode"] = debug_mode
+    if replay_mode:
+        manager.replay_cache.set_mode(replay_mode)
+    if manager.config.get("journal", {}).get("enabled", False):
+        manager.start_journal(os.path.join(output_dir, f"{name}.jsonl"))
+    if "seed" in scenario:
+        for user_data in manager.users_data:
+            user_data["seed"] = scenario["seed"]
+
+    try:
+        await manager.initialize_agents()
+        await manager.run_auto(scenario.get("rounds", default_rounds))
+        result["status"] = "ok"
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = str(e)
+    finally:
+        # 出错时也导出已产生的部分历史
+        result["turns"] = len(manager.global_history)
+        result["path"] = manager.export_history(f"{name}.json", directory=output_dir)
+        await manager.shutdown()
+
+    result["duration"] = round(time.perf_counter() - start, 3)
+    _append_result(output_dir, result)
+    return result
+
+
+async def run_batch(spec, on_result=None):
+    """在同一事件循环上并发运行多个场景，返回所有场景的结果列表"""
+    scenarios = spec.get("scenarios", [])
+    for i, scenario in enumerate(scenarios):
+        scenario.setdefault("name", f"scenario_{i:03d}")
+
+    output_dir = spec.get("output_dir") or os.path.join("history", f"batch_{datetime.now().strftime('%m%d_%H%M%S')}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    request_gate = RequestGate(
+        max_in_flight=spec.get("max_in_flight"),
+        rate_limits=spec.get("rate_limits"),
+        default_rate=spec.get("default_rate"),
+    )
+    conversation_slots = asyncio.Semaphore(spec.get("max_conversations") or max(len(scenarios), 1))
+    endpoint_guards = EndpointGuards(spec.get("resilience"))
+    client_registry = ClientRegistry(http_config_for(spec.get("http"), endpoint_guards))
+    default_rounds = spec.get("rounds", 10)
+    debug_mode = spec.get("debug_mode", False)
+    replay_mode = spec.get("replay_mode")
+
+    async def run_one(scenario):
+        async with conversation_slots:
+            result = await run_scenario(scenario, request_gate, output_dir, default_rounds, debug_mode,
+                                        client_registry, replay_mode, endpoint_guards)
+        if on_result:
+            on_result(result)
+        return result
+
+    try:
+        return await asyncio.gather(*(run_one(s) for s in scenarios))
+    finally:
+        await client_registry.aclose()
@@ -0,0 +1,216 @@
+import json
+from datetime import datetime, timedelta
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+# 空工具链在绝大多数消息中出现，共享同一个对象
+_EMPTY_LIST_JSON = "[]"
+# message_entry 的固定字段，导出时按此顺序输出，其余字段原样附在后面
+_FIELDS = ("role_id", "role_name", "content", "timestamp", "internal_thoughts", "metrics")
+
+
+def _compact_json(value):
+    if value == []:
+        return _EMPTY_LIST_JSON
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _pack_timestamp(text):
+    """ISO 时间戳转为整数微秒；无法无损还原（带时区等）时保留原字符串"""
+    try:
+        dt = datetime.fromisoformat(text)
+    except (TypeError, ValueError):
+        return text
+    if dt.tzinfo is not None:
+        return text
+    packed = (dt - _EPOCH) // _MICROSECOND
+    return packed if _unpack_timestamp(packed) == text else text
+
+
+def _unpack_timestamp(value):
+    if isinstance(value, int):
+        return (_EPOCH + value * _MICROSECOND).isoformat()
+    return value
+
+
+class Speaker:
+    """驻留的角色引用，同一角色的所有消息共享一个实例"""
+    __slots__ = ("role_id", "role_name")
+
+    def __init__(self, role_id, role_name):
+        self.role_id = role_id
+        self.role_name = role_name
+
+
+class MessageRecord:
+    """
+    global_history 中的一条消息。
+    时间戳存为整数微秒，工具链与统计信息存为紧凑 JSON，访问时才还原为 dict。
+    支持 msg['content']、msg.get('internal_thoughts') 等与原 dict 相同的读取方式。
+    """
+    __slots__ = ("speaker", "content", "_ts", "_thoughts", "_metrics", "extra")
+
+    def __init__(self, speaker, content, ts, thoughts_json, metrics_json=None, extra=None):
+        self.speaker = speaker
+        self.content = content
+        self._ts = ts
+        # None 表示原消息没有该字段
+        self._thoughts = thoughts_json
+        self._metrics = metrics_json
+        self.extra = extra
+
+    @property
+    def role_id(self):
+        return self.speaker.role_id
+
+    @property
+    def role_name(self):
+        return self.speaker.role_name
+
+    @property
+    def timestamp(self):
+        return _unpack_timestamp(self._ts)
+
+    @property
+    def internal_thoughts(self):
+        return json.loads(self._thoughts) if self._thoughts is not None else None
+
+    @property
+    def metrics(self):
+        return json.loads(self._metrics) if self._metrics is not None else None
+
+    @property
+    def has_tools(self):
+        return self._thoughts is not None and self._thoughts is not _EMPTY_LIST_JSON
+
+    def _present(self, key):
+        if key == "internal_thoughts":
+            return self._thoughts is not None
+        if key == "metrics":
+            return self._metrics is not None
+        if key == "timestamp":
+            return self._ts is not None
+        return True
+
+    def __getitem__(self, key):
+        if key in _FIELDS:
+            if not self._present(key):
+                raise KeyError(key)
+            return getattr(self, key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in _FIELDS:
+            return self._present(key)
+        return bool(self.extra) and key in self.extra
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        """还原为导出格式的 dict"""
+        entry = {"role_id": self.role_id, "role_name": self.role_name, "content": self.content}
+        if self._ts is not None:
+            entry["timestamp"] = self.timestamp
+        if self._thoughts is not None:
+            entry["internal_thoughts"] = self.internal_thoughts
+        if self._metrics is not None:
+            entry["metrics"] = self.metrics
+        if self.extra:
+            entry.update(self.extra)
+        return entry
+
+
+class History:
+    """
+    紧凑的对话历史容器：O(1) 下标访问，按角色维护消息序号列表，角色引用驻留。
+    导入/导出格式与原来的 list[dict] 完全一致。
+    """
+    def __init__(self, entries=None):
+        self._records = []
+        self._speakers = {}
+        # role_id -> 该角色消息在历史中的序号（升序）
+        self._by_agent = {}
+        for entry in entries or ():
+            self.append(entry)
+
+    def _speaker(self, role_id, role_name):
+        key = (role_id, role_name)
+        speaker = self._speakers.get(key)
+        if speaker is None:
+            speaker = Speaker(role_id, role_name)
+            self._speakers[key] = speaker
+        return speaker
+
+    def make_record(self, entry):
+        """把 message_entry dict 转为 MessageRecord（使用本容器的角色驻留表）"""
+        if isinstance(entry, MessageRecord):
+            return entry
+        extra = {k: v for k, v in entry.items() if k not in _FIELDS} or None
+        thoughts = entry.get("internal_thoughts")
+        metrics = entry.get("metrics")
+        ts = entry.get("timestamp")
+        return MessageRecord(
+            self._speaker(entry["role_id"], entry["role_name"]),
+            entry["content"],
+            _pack_timestamp(ts) if ts is not None else None,
+            _compact_json(thoughts) if "internal_thoughts" in entry else None,
+            _compact_json(metrics) if "metrics" in entry else None,
+            extra,
+        )
+
+    def append(self, entry):
+        record = self.make_record(entry)
+        self._by_agent.setdefault(record.role_id, []).append(len(self._records))
+        self._records.append(record)
+        return record
+
+    def pop(self, index):
+        if index < 0:
+            index += len(self._records)
+        record = self._records.pop(index)
+        # 删除是低频操作，直接重建受影响的序号
+        for role_id, indices in self._by_agent.items():
+            self._by_agent[role_id] = [i if i < index else i - 1 for i in indices if i != index]
+        return record
+
+    def indices_for(self, role_id):
+        """某角色所有消息的序号"""
+        return list(self._by_agent.get(role_id, ()))
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __getitem__(self, index):
+        return self._records[index]
+
+    def __bool__(self):
+        return bool(self._records)
+
+    def iter_dicts(self):
+        for record in self._records:
+            yield record.to_dict()
+
+    def to_list(self):
+        return list(self.iter_dicts())
+
+    def dump(self, f):
+        """逐条写出，与 json.dump(list, f, ensure_ascii=False, indent=2) 的输出一致，但不整体物化"""
+        if not self._records:
+            f.write("[]")
+            return
+        f.write("[\n")
+        for i, entry in enumerate(self.iter_dicts()):
+            if i:
+                f.write(",\n")
+            text = json.dumps(entry, ensure_ascii=False, indent=2)
+            f.write("\n".join("  " + line for line in text.split("\n")))
+        f.write("\n]")
@@ -0,0 +1,68 @@
+import importlib.util
+
+
+def http2_available():
+    """HTTP/2 需要可选依赖 h2 (pip install "httpx[http2]")，只检查是否安装，不导入"""
+    return importlib.util.find_spec("h2") is not None
+
+
+class ClientRegistry:
+    """
+    AsyncOpenAI 客户端注册表：按 (base_url, api_key, headers) 复用客户端。
+    所有客户端共享同一个 httpx.AsyncClient 连接池，使 keep-alive 连接可以跨角色、跨轮次复用。
+    httpx / openai 在首次创建客户端时才导入，只浏览历史时不产生导入开销。
+
+    http_config 来自 config.json 的 "http" 部分:
+      http2, max_connections, max_keepalive_connections, keepalive_expiry, timeout, max_retries
+    """
+    def __init__(self, http_config=None):
+        self.http_config = http_config or {}
+        self._http_client = None
+        self._clients = {}
+
+    @property
+    def http_client(self):
+        if self._http_client is None:
+            import httpx
+
+            cfg = self.http_config
+            http2 = cfg.get("http2", True)
+            if http2 and not http2_available():
+                print("[WARN] 未安装 h2，HTTP/2 已禁用 (pip install \"httpx[http2]\")")
+                http2 = False
+            self._http_client = httpx.AsyncClient(
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=cfg.get("max_connections", 100),
+                    max_keepalive_connections=cfg.get("max_keepalive_connections", 20),
+                    keepalive_expiry=cfg.get("keepalive_expiry", 30.0),
+                ),
+                timeout=httpx.Timeout(cfg.get("timeout", 30.0), connect=cfg.get("connect_timeout", 10.0)),
+                follow_redirects=True,
+            )
+        return self._http_client
+
+    def get_client(self, base_url, api_key, headers=None):
+        headers = headers or {}
+        key = (base_url, api_key, tuple(sorted(headers.items())))
+        client = self._clients.get(key)
+        if client is None:
+            from openai import AsyncOpenAI
+
+            client = AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                max_retries=self.http_config.get("max_retries", 2),
+                timeout=self.http_config.get("timeout", 30.0),
+                default_headers=headers,
+                http_client=self.http_client,
+            )
+            self._clients[key] = client
+        return client
+
+    async def aclose(self):
+        """关闭共享连接池（退出时调用）"""
+        self._clients = {}
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
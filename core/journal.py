@@ -0,0 +1,101 @@
+import json
+import os
+
+
+class HistoryJournal:
+    """
+    追加写入的 JSONL 历史日志，每完成一条消息立即落盘，崩溃时最多丢失正在生成的一条。
+
+    每行一条记录:
+      {"op": "add", "seq": 3, "entry": {...message_entry...}}
+      {"op": "del", "seq": 3}              # 删除以墓碑记录表示，不改写旧行
+    compact() 会用当前存活的消息重写整个文件并清除墓碑。
+    """
+    def __init__(self, path, fsync=True, compact_ratio=0.5, compact_min=64):
+        self.path = path
+        self.fsync = fsync
+        # 墓碑数超过 compact_min 且占存活记录比例超过 compact_ratio 时自动压缩
+        self.compact_ratio = compact_ratio
+        self.compact_min = compact_min
+        # 与 global_history 一一对应的记录序号
+        self.seqs = []
+        self.tombstones = 0
+        self._next_seq = 0
+        self._file = None
+        # 序号从 0 开始，同一路径上的旧日志必须丢弃，否则回放时新旧记录会按 seq 混在一起
+        self._started = False
+
+    def _write(self, record):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, 'a' if self._started else 'w', encoding='utf-8')
+            self._started = True
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def append(self, entry):
+        seq = self._next_seq
+        self._next_seq += 1
+        self._write({"op": "add", "seq": seq, "entry": entry})
+        self.seqs.append(seq)
+
+    def delete(self, index):
+        seq = self.seqs.pop(index)
+        self._write({"op": "del", "seq": seq})
+        self.tombstones += 1
+
+    def needs_compaction(self):
+        return self.tombstones >= self.compact_min and self.tombstones > len(self.seqs) * self.compact_ratio
+
+    def compact(self, entries):
+        """用 entries（message_entry dict 的可迭代对象）重写日志，先写临时文件再原子替换，序号从 0 重新编号"""
+        self.close()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        count = 0
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps({"op": "add", "seq": count, "entry": entry}, ensure_ascii=False) + "\n")
+                count += 1
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._started = True
+        self.seqs = list(range(count))
+        self._next_seq = count
+        self.tombstones = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @staticmethod
+    def iter_records(path):
+        """逐行读取日志记录，跳过崩溃时写了一半的末行"""
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"[WARN] 日志 {path} 第 {line_no} 行不完整，已跳过")
+
+    @classmethod
+    def load(cls, path, convert=None):
+        """流式回放日志，返回存活的消息列表；只在内存中保留存活记录
+        convert 可将每条 entry 在读取时转为更紧凑的表示（如 History.make_record）
+        """
+        live = {}
+        for record in cls.iter_records(path):
+            if record.get("op") == "add":
+                entry = record["entry"]
+                live[record["seq"]] = convert(entry) if convert else entry
+            elif record.get("op") == "del":
+                live.pop(record["seq"], None)
+        # dict 保持插入顺序，即消息原始顺序
+        return list(live.values())
@@ -0,0 +1,48 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+
+class RateLimiter:
+    """按固定间隔放行请求的限速器，rate 为每分钟请求数"""
+    def __init__(self, rate_per_minute):
+        self.interval = 60.0 / rate_per_minute
+        self._next_time = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class RequestGate:
+    """
+    模型请求闸门：全局在途请求上限 + 按 base_url 的限速。
+    同一个 gate 可以被多个 DialogueManager 共享（批量运行时）。
+    """
+    def __init__(self, max_in_flight=None, rate_limits=None, default_rate=None):
+        self._semaphore = asyncio.Semaphore(max_in_flight) if max_in_flight else None
+        self._rate_limits = rate_limits or {}
+        self._default_rate = default_rate
+        self._limiters = {}
+
+    def _limiter_for(self, base_url):
+        if base_url not in self._limiters:
+            rate = self._rate_limits.get(base_url, self._default_rate)
+            self._limiters[base_url] = RateLimiter(rate) if rate else None
+        return self._limiters[base_url]
+
+    @asynccontextmanager
+    async def slot(self, base_url):
+        limiter = self._limiter_for(base_url)
+        if limiter:
+            await limiter.acquire()
+        if self._semaphore:
+            async with self._semaphore:
+                yield
+        else:
+            yield
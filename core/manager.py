@@ -1,57 +1,178 @@
+import asyncio
 import json
 import os
+import time
 from datetime import datetime
 from .agent import ScamAgent
+from .history import History
+from .http_pool import ClientRegistry
+from .journal import HistoryJournal
 from .mcp_client import MCPClientManager
+from .replay import ReplayCache
+from .resilience import EndpointGuards, http_config_for
+from .scheduler import create_scheduler
 
 class DialogueManager:
-    def __init__(self, config_path="config.json", user_path="user.json"):
+    def __init__(self, config_path="config.json", user_path="user.json", request_gate=None, client_registry=None,
+                 endpoint_guards=None):
         with open(config_path, 'r', encoding='utf-8') as f:
             self.config = json.load(f)
         with open(user_path, 'r', encoding='utf-8') as f:
             self.users_data = json.load(f)
 
-        self.mcp_manager = MCPClientManager(self.config.get("mcp_registry", {}))
+        self.mcp_manager = MCPClientManager(
+            self.config.get("mcp_registry", {}),
+            schema_cache_dir=self.config.get("tool_schema_cache", ".cache/tool_schemas"),
+            tool_cache_bytes=self.config.get("tool_cache_max_bytes", 8 * 1024 * 1024),
+        )
+        self.request_gate = request_gate
+        # 按 base_url 的重试退避与熔断 (config.json 的 resilience)，批量运行时由外部传入共享实例
+        self.endpoint_guards = endpoint_guards or EndpointGuards(self.config.get("resilience"))
+        # 未传入时自建连接池注册表，并在 shutdown 时负责关闭
+        self._owns_client_registry = client_registry is None
+        self.client_registry = client_registry or ClientRegistry(
+            http_config_for(self.config.get("http"), self.endpoint_guards)
+        )
+        # 模型响应回放缓存，模式见 core.replay (passthrough / record / replay)
+        replay_cfg = self.config.get("replay", {})
+        self.replay_cache = ReplayCache(replay_cfg.get("dir", ".cache/replay"), replay_cfg.get("mode", "passthrough"))
         self.agents = {}
-        self.global_history = [] 
+        self.global_history = History()
+        # 追加写入的 JSONL 日志（config.json 的 journal.enabled 开启），首次写入时创建
+        self.journal = None
+        # initialize_agents 各阶段耗时
+        self.startup_report = {}
+        # 发言调度器（initialize_agents 后创建）与本会话已执行的自动轮数
+        self.scheduler = None
+        self.rounds_done = 0
 
-    async def initialize_agents(self):
-        """初始化所有角色及其私有工具链"""
+    async def initialize_agents(self, lazy=False):
+        """初始化所有角色及其私有工具链（工具并发加载），返回各阶段耗时
+        lazy=True 时只构造角色，工具在各角色首次发言时加载（见 ScamAgent.ensure_tools）
+        """
         debug_mode = self.config.get("debug_mode", False)
+        start = time.perf_counter()
         
         for user_data in self.users_data:
             mcp_client = self.mcp_manager.get_client_for_agent(user_data.get("mcp_servers", []))
-            agent = ScamAgent(user_data, mcp_client, debug_mode=debug_mode)
-            await agent.init_tools()
+            agent = ScamAgent(user_data, mcp_client, debug_mode=debug_mode, request_gate=self.request_gate,
+                              client_registry=self.client_registry, replay_cache=self.replay_cache,
+                              endpoint_guards=self.endpoint_guards)
+            agent.stream = self.config.get("stream", False)
             self.agents[user_data["id"]] = agent
+        constructed = time.perf_counter()
+
+        # 同一 server 的工具定义只加载/转换一次，由所有角色共享
+        if not lazy:
+            await asyncio.gather(*(agent.ensure_tools() for agent in self.agents.values()))
+        finished = time.perf_counter()
+
+        self.scheduler = create_scheduler(self.agents, self.config.get("scheduler"))
+
+        self.startup_report = {
+            "construct_agents": round(constructed - start, 3),
+            "init_tools": round(finished - constructed, 3),
+            "total": round(finished - start, 3),
+            "lazy": lazy,
+            "mcp_servers": dict(self.mcp_manager.load_stats),
+        }
+        return self.startup_report
     
+    async def shutdown(self):
+        """释放共享资源（MCP 会话、HTTP 连接池），退出前调用"""
+        await self.mcp_manager.aclose()
+        if self.journal:
+            self.journal.close()
+        if self._owns_client_registry:
+            await self.client_registry.aclose()
+
+    @property
+    def streaming(self):
+        return self.config.get("stream", False)
+
     def set_debug(self, enabled: bool):
         self.config["debug_mode"] = enabled
         for agent in self.agents.values():
             agent.debug_mode = enabled
         print(f"Debug 模式已{'开启' if enabled else '关闭'}。")
 
-    async def agent_speak(self, agent_id: str):
-        """让指定角色生成下一条消息"""
+    async def agent_speak(self, agent_id: str, on_delta=None):
+        """让指定角色生成下一条消息，流式模式下回复片段逐块回调 on_delta(text)"""
         if agent_id not in self.agents:
             return None
 
+        message_entry = await self._generate_entry(agent_id, on_delta)
+        self._commit_entry(message_entry)
+        return message_entry
+
+    async def _generate_entry(self, agent_id, on_delta=None):
+        """基于当前 global_history 生成一条消息，但不写入历史"""
         agent = self.agents[agent_id]
         
         # 获取回复文本 和 内部思考过程(工具调用日志)
-        response_text, internal_thoughts = await agent.generate_response(self.global_history)
+        response_text, internal_thoughts = await agent.generate_response(self.global_history, on_delta=on_delta)
         
-        message_entry = {
+        return {
             "role_id": agent.id,
             "role_name": agent.name,
             "content": response_text,
             "timestamp": datetime.now().isoformat(),
             # 这里保存了工具调用链，用于该角色后续的上下文恢复，以及导出
-            "internal_thoughts": internal_thoughts 
+            "internal_thoughts": internal_thoughts,
+            # 本轮统计信息 (首 token 延迟等)
+            "metrics": agent.last_turn_metrics
         }
+
+    def _commit_entry(self, message_entry):
         self.global_history.append(message_entry)
-        
-        return message_entry
+        self._journal_append(message_entry)
+
+    @property
+    def max_rounds(self):
+        """config.json 的 max_rounds，<= 0 表示不限制"""
+        return self.config.get("max_rounds", -1)
+
+    async def run_auto(self, n: int, on_turn=None, on_message=None, on_delta=None):
+        """由调度器驱动自动对话 n 步，受 config.json 的 max_rounds 限制
+        on_turn(i, agent_ids) 在每步开始时回调，on_message(i, msg) 在每条消息写入后回调；
+        流式模式下 on_delta(text) 逐块回调回复文本（仅单人发言的步骤）。
+        同一步有多个发言者时，基于同一历史快照并发生成，并按调度顺序写入历史。
+        """
+        if not self.agents:
+            return []
+
+        messages = []
+        for i in range(n):
+            if 0 < self.max_rounds <= self.rounds_done:
+                print(f"[*] 已达到 max_rounds ({self.max_rounds})，自动对话停止。")
+                break
+
+            agent_ids = await self.scheduler.next_speakers(self.global_history, self.rounds_done)
+            if on_turn:
+                on_turn(i, agent_ids)
+
+            if len(agent_ids) == 1:
+                entries = [await self._generate_entry(agent_ids[0], on_delta)]
+            else:
+                # 生成期间不写历史，所有角色看到同一快照
+                results = await asyncio.gather(
+                    *(self._generate_entry(aid) for aid in agent_ids), return_exceptions=True
+                )
+                entries = [r for r in results if not isinstance(r, BaseException)]
+                errors = [r for r in results if isinstance(r, BaseException)]
+                if errors:
+                    # 先保存成功的结果，再抛出第一个错误
+                    for entry in entries:
+                        self._commit_entry(entry)
+                    raise errors[0]
+
+            self.rounds_done += 1
+            for entry in entries:
+                self._commit_entry(entry)
+                messages.append(entry)
+                if on_message:
+                    on_message(i, entry)
+        return messages
 
     def delete_message(self, index: int):
         """根据序号删除消息"""
@@ -59,27 +180,83 @@ class DialogueManager:
         # 删除这个 entry 会自动连带删除所有的 tool calls
         if 0 <= index < len(self.global_history):
             removed = self.global_history.pop(index)
+            self._invalidate_contexts(index)
+            if self.journal:
+                self.journal.delete(index)
+                if self.journal.needs_compaction():
+                    self.journal.compact(self.global_history.iter_dicts())
             return removed
         return None
 
-    def export_history(self, filename=None):
+    def export_history(self, filename=None, directory="history"):
         """将历史记录导出为 JSON，包含工具调用详情"""
         if not filename:
             filename = f"history_{datetime.now().strftime('%m%d_%H%M')}.json"
         
-        path = os.path.join("history", filename)
-        os.makedirs("history", exist_ok=True)
+        path = os.path.join(directory, filename)
+        os.makedirs(directory, exist_ok=True)
         
         with open(path, 'w', encoding='utf-8') as f:
-            # internal_thoughts 已经是 dict 格式，可以直接序列化
-            json.dump(self.global_history, f, ensure_ascii=False, indent=2)
+            # 逐条还原为 dict 写出，格式与 json.dump(..., indent=2) 相同
+            self.global_history.dump(f)
         return path
 
     async def load_history(self, file_path):
-        """从文件加载历史记录"""
+        """从文件加载历史记录，支持导出的 .json 与日志 .jsonl"""
         if not os.path.exists(file_path):
             print(f"文件不存在: {file_path}")
             return
-            
-        with open(file_path, 'r', encoding='utf-8') as f:
-            self.global_history = json.load(f)
\ No newline at end of file
+
+        history = History()
+        if file_path.endswith(".jsonl"):
+            # 日志逐行流式回放，不整体读入，读取时即转为紧凑记录
+            records = HistoryJournal.load(file_path, convert=history.make_record)
+        else:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+        for record in records:
+            history.append(record)
+        self.global_history = history
+        self._invalidate_contexts()
+        # 当前会话日志以加载后的历史重新开始
+        if self.journal:
+            self.journal.compact(self.global_history.iter_dicts())
+
+    def start_journal(self, path=None):
+        """开启追加写入日志，已有历史会先作为快照写入"""
+        journal_cfg = self.config.get("journal", {})
+        if not path:
+            directory = journal_cfg.get("dir", "history")
+            path = os.path.join(directory, f"session_{datetime.now().strftime('%m%d_%H%M%S')}.jsonl")
+        if self.journal:
+            self.journal.close()
+        self.journal = HistoryJournal(
+            path,
+            fsync=journal_cfg.get("fsync", True),
+            compact_ratio=journal_cfg.get("compact_ratio", 0.5),
+            compact_min=journal_cfg.get("compact_min", 64),
+        )
+        if self.global_history:
+            self.journal.compact(self.global_history.iter_dicts())
+        return path
+
+    def _journal_append(self, message_entry):
+        if self.journal is None:
+            if not self.config.get("journal", {}).get("enabled", False):
+                return
+            # 首次写入：快照中已包含本条消息
+            self.start_journal()
+            return
+        self.journal.append(message_entry)
+
+    def compact_journal(self):
+        """压缩日志，清除墓碑记录；返回日志路径（未开启日志时返回 None）"""
+        if not self.journal:
+            return None
+        self.journal.compact(self.global_history.iter_dicts())
+        return self.journal.path
+
+    def _invalidate_contexts(self, deleted_index=None):
+        """历史被非追加方式修改后，清空所有角色的增量上下文缓存（删除消息时传入其序号，以便保留摘要）"""
+        for agent in self.agents.values():
+            agent.invalidate_context(deleted_index)
\ No newline at end of file
@@ -1,24 +1,352 @@
-from langchain_mcp_adapters.client import MultiServerMCPClient
+import asyncio
+import hashlib
+import json
+import os
+import time
+from .tool_cache import ToolResultCache
+
+# langchain_core / langchain_mcp_adapters 导入较慢，均在首次使用处导入，离线浏览历史时不加载
+
+# mcp_registry 条目中由本项目使用、不属于 MCP 连接参数的键
+NON_CONNECTION_KEYS = ("cache",)
+
+
+class PooledServer:
+    """
+    单个 MCP server 的长连接会话。
+    client.session() 在独立的后台任务中进入和退出（stdio 传输要求同一任务内完成），
+    其他任务只通过 self.tools 调用工具。
+    """
+    def __init__(self, name, client, ping_timeout=5.0):
+        self.name = name
+        self.client = client
+        self.ping_timeout = ping_timeout
+        self.session = None
+        self.tools = {}
+        # 每次重连递增，用于避免并发失败时重复重连
+        self.generation = 0
+        self._task = None
+        self._stop = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def alive(self):
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def _run(self, ready):
+        from langchain_mcp_adapters.tools import load_mcp_tools
+
+        try:
+            async with self.client.session(self.name) as session:
+                tools = await load_mcp_tools(session)
+                self.session = session
+                self.tools = {t.name: t for t in tools}
+                ready.set_result(None)
+                await self._stop.wait()
+        except asyncio.CancelledError:
+            if not ready.done():
+                ready.cancel()
+            raise
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                print(f"[WARN] MCP 服务 {self.name} 连接中断: {e}")
+        finally:
+            self.session = None
+
+    async def _start(self):
+        ready = asyncio.get_running_loop().create_future()
+        self._stop = asyncio.Event()
+        self._task = asyncio.create_task(self._run(ready))
+        await ready
+        self.generation += 1
+
+    async def _stop_task(self):
+        if self._task is None:
+            return
+        self._stop.set()
+        try:
+            await self._task
+        except BaseException:
+            pass
+        self._task = None
+
+    async def ensure(self):
+        """确保会话可用，未连接或已断开时(重新)连接"""
+        async with self._lock:
+            if not self.alive:
+                await self._stop_task()
+                await self._start()
+
+    async def reconnect(self, generation):
+        """重建会话；若其他调用已完成重连(generation 已变化)则直接返回"""
+        async with self._lock:
+            if generation != self.generation and self.alive:
+                return
+            await self._stop_task()
+            await self._start()
+
+    async def ping(self):
+        if not self.alive:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout=self.ping_timeout)
+            return True
+        except Exception:
+            return False
+
+    async def close(self):
+        async with self._lock:
+            await self._stop_task()
+
+
+class AgentMCPClient:
+    """
+    角色私有的 MCP 客户端视图：只暴露该角色 mcp_servers 中声明的工具，
+    底层会话与工具定义由 MCPClientManager 在所有角色间共享。
+    """
+    def __init__(self, manager, server_names):
+        self.manager = manager
+        self.server_names = server_names
+        # 最近一次 load_tools 中加载失败的 server，调用方据此决定是否重试
+        self.failed_servers = []
+
+    async def load_tools(self):
+        """
+        返回 (代理工具列表, OpenAI 工具定义列表)，单个 server 失败不影响其他 server，
+        失败的 server 记录在 failed_servers 中（已成功的 server 由 manager 缓存，重试时不会重复加载）
+        """
+        tools, openai_tools, failed = [], [], []
+        for server_name in self.server_names:
+            try:
+                server_tools, server_schemas = await self.manager.get_server_tools(server_name)
+            except Exception as e:
+                print(f"[ERROR] MCP 服务 {server_name} 工具加载失败: {e}")
+                failed.append(server_name)
+                continue
+            tools.extend(server_tools)
+            openai_tools.extend(server_schemas)
+        self.failed_servers = failed
+        return tools, openai_tools
+
+    async def get_tools(self):
+        tools, _ = await self.load_tools()
+        return tools
+
 
 class MCPClientManager:
-    def __init__(self, mcp_registry):
+    def __init__(self, mcp_registry, schema_cache_dir=".cache/tool_schemas", tool_cache_bytes=8 * 1024 * 1024):
         """
         mcp_registry: 来自 config.json 的 mcp_registry 部分
+        schema_cache_dir: 转换后的 OpenAI 工具定义缓存目录，None 表示不落盘
+        tool_cache_bytes: 工具结果缓存的内存上限（字节）
         """
         self.registry = mcp_registry
+        # 传给 MultiServerMCPClient 的纯连接配置
+        self.connections = {
+            name: {k: v for k, v in entry.items() if k not in NON_CONNECTION_KEYS}
+            for name, entry in mcp_registry.items()
+        }
+        self.schema_cache_dir = schema_cache_dir
+        # 工具结果缓存，按 server 的 cache 配置选择性启用
+        self.result_cache = ToolResultCache(max_bytes=tool_cache_bytes)
+        self._client = None
+        # server 名称 -> PooledServer，所有角色共享
+        self.servers = {}
+        # server 名称 -> 加载工具定义的任务，并发初始化的角色共享同一次加载
+        self._tool_loads = {}
+        # 启动阶段统计: server 名称 -> {"source", "connect", "convert", "tools"}
+        self.load_stats = {}
+
+    @property
+    def client(self):
+        if self._client is None:
+            from langchain_mcp_adapters.client import MultiServerMCPClient
+
+            self._client = MultiServerMCPClient(self.connections)
+        return self._client
 
     def get_client_for_agent(self, agent_mcp_servers):
         """
-        根据角色需要的 server 列表，创建一个私有的 MCP 客户端
+        根据角色需要的 server 列表，返回该角色的私有工具视图
         """
-        # 过滤出该角色需要的服务器配置
-        agent_configs = {
-            name: self.registry[name] 
-            for name in agent_mcp_servers 
-            if name in self.registry
+        # 过滤出该角色需要的服务器
+        server_names = [name for name in agent_mcp_servers if name in self.registry]
+
+        if not server_names:
+            return None
+
+        return AgentMCPClient(self, server_names)
+
+    async def get_server(self, name):
+        """获取(必要时建立)共享会话"""
+        server = self.servers.get(name)
+        if server is None:
+            server = PooledServer(name, self.client)
+            self.servers[name] = server
+        await server.ensure()
+        return server
+
+    def _schema_cache_path(self, name):
+        config_json = json.dumps(self.connections[name], sort_keys=True, ensure_ascii=False)
+        digest = hashlib.sha256(config_json.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.schema_cache_dir, f"{name}_{digest}.json")
+
+    def _read_schema_cache(self, name):
+        if not self.schema_cache_dir:
+            return None
+        path = self._schema_cache_path(name)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def _write_schema_cache(self, name, schemas):
+        """磁盘缓存只用于加速下次启动，写入失败（只读目录、磁盘已满、无权限）不影响本次加载"""
+        if not self.schema_cache_dir:
+            return
+        path = self._schema_cache_path(name)
+        tmp_path = path + ".tmp"
+        try:
+            os.makedirs(self.schema_cache_dir, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(schemas, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[WARN] MCP 服务 {name}: 工具定义缓存写入失败，下次启动将重新转换: {e}")
+
+    async def _load_tool_schemas(self, name):
+        """加载 server 的 OpenAI 工具定义：命中磁盘缓存时不连接、不转换，会话推迟到首次调用时建立"""
+        schemas = self._read_schema_cache(name)
+        if schemas is not None:
+            self.load_stats[name] = {"source": "cache", "connect": 0.0, "convert": 0.0, "tools": len(schemas)}
+            return schemas
+
+        from langchain_core.utils.function_calling import convert_to_openai_tool
+
+        start = time.perf_counter()
+        server = await self.get_server(name)
+        connected = time.perf_counter()
+        schemas = []
+        for tool in server.tools.values():
+            try:
+                tool_def = convert_to_openai_tool(tool)
+                if "type" not in tool_def:
+                    tool_def = {"type": "function", "function": tool_def}
+                schemas.append(tool_def)
+            except Exception as e:
+                print(f"[WARN] MCP 服务 {name}: 转换工具 {tool.name} 失败: {e}")
+        self.load_stats[name] = {
+            "source": "server",
+            "connect": round(connected - start, 3),
+            "convert": round(time.perf_counter() - connected, 3),
+            "tools": len(schemas),
         }
-        
-        if not agent_configs:
+        self._write_schema_cache(name, schemas)
+        return schemas
+
+    async def get_server_tools(self, name):
+        """返回 server 的 (代理工具列表, OpenAI 工具定义列表)，结果在所有角色间共享"""
+        task = self._tool_loads.get(name)
+        if task is None:
+            task = asyncio.ensure_future(self._load_tool_schemas(name))
+            self._tool_loads[name] = task
+        try:
+            schemas = await task
+        except Exception:
+            # 失败的加载不缓存，下次重试
+            self._tool_loads.pop(name, None)
+            raise
+        tools = [self._proxy_tool(name, schema["function"]) for schema in schemas]
+        return tools, schemas
+
+    def _proxy_tool(self, server_name, function_def):
+        """按工具定义构造代理工具，调用时转发到池中当前有效的会话（未连接时自动连接，重连后仍可用）"""
+        from langchain_core.tools import StructuredTool
+
+        tool_name = function_def["name"]
+
+        async def call_tool(**arguments):
+            return await self.call_tool(server_name, tool_name, arguments)
+
+        return StructuredTool(
+            name=tool_name,
+            description=function_def.get("description", ""),
+            args_schema=function_def.get("parameters", {"type": "object", "properties": {}}),
+            coroutine=call_tool,
+        )
+
+    def _cache_ttl(self, server_name, tool_name):
+        """
+        返回该工具结果的缓存秒数，不缓存时返回 None。server 的 cache 配置:
+          {"ttl": 60, "tool_ttl": {"get_rate": 5}, "allow": [...], "deny": [...]}
+        未配置 cache 的 server 不缓存；有副作用的工具放进 deny 即可排除。
+        """
+        cache_cfg = self.registry.get(server_name, {}).get("cache")
+        if not cache_cfg:
+            return None
+        if tool_name in cache_cfg.get("deny", []):
+            return None
+        allow = cache_cfg.get("allow")
+        if allow is not None and tool_name not in allow:
             return None
-            
-        return MultiServerMCPClient(agent_configs)
\ No newline at end of file
+        ttl = cache_cfg.get("tool_ttl", {}).get(tool_name, cache_cfg.get("ttl", 60))
+        return ttl if ttl and ttl > 0 else None
+
+    async def call_tool(self, server_name, tool_name, arguments):
+        ttl = self._cache_ttl(server_name, tool_name)
+        if ttl is None:
+            return await self._call_tool(server_name, tool_name, arguments)
+
+        key = ToolResultCache.make_key(server_name, tool_name, arguments)
+        hit, value = self.result_cache.get(key)
+        if hit:
+            return value
+        value = await self._call_tool(server_name, tool_name, arguments)
+        self.result_cache.put(key, value, ttl)
+        return value
+
+    async def _call_tool(self, server_name, tool_name, arguments):
+        from langchain_core.tools import ToolException
+
+        server = await self.get_server(server_name)
+        generation = server.generation
+        if tool_name not in server.tools:
+            raise ToolException(f"Tool {tool_name} not found on MCP server {server_name}.")
+        try:
+            return await server.tools[tool_name].ainvoke(arguments)
+        except ToolException:
+            # 工具自身返回的错误，与连接无关
+            raise
+        except Exception:
+            if await server.ping():
+                raise
+            # 会话已失效：重连后重试一次
+            print(f"[WARN] MCP 服务 {server_name} 无响应，正在重连...")
+            await server.reconnect(generation)
+            return await server.tools[tool_name].ainvoke(arguments)
+
+    async def health_check(self):
+        """检查所有已建立的会话，失效的自动重连。返回 {server: 是否健康}"""
+        results = {}
+        for name, server in list(self.servers.items()):
+            if await server.ping():
+                results[name] = True
+                continue
+            try:
+                await server.reconnect(server.generation)
+                results[name] = await server.ping()
+            except Exception as e:
+                print(f"[WARN] MCP 服务 {name} 重连失败: {e}")
+                results[name] = False
+        return results
+
+    async def aclose(self):
+        """关闭所有共享会话（退出时调用）"""
+        for server in self.servers.values():
+            await server.close()
+        self.servers = {}
@@ -0,0 +1,46 @@
+def percentile(values, pct):
+    """线性插值百分位数，values 为空时返回 None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    low = int(k)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+
+def summarize_metrics(history):
+    """
+    按角色汇总 message_entry 中的 metrics。
+    返回 {role_id: {"name", "turns", "latency", "ttft", "build_context", "model", "tool",
+                    "prompt_tokens", "completion_tokens", "iterations"}}，
+    其中耗时项为 {"p50", "p95"}（秒）。
+    """
+    raw = {}
+    for msg in history:
+        metrics = msg.get("metrics")
+        if not metrics or "total" not in metrics:
+            continue
+        agent = raw.setdefault(msg["role_id"], {
+            "name": msg["role_name"], "turns": 0,
+            "latency": [], "ttft": [], "build_context": [], "model": [], "tool": [],
+            "prompt_tokens": 0, "completion_tokens": 0, "iterations": 0,
+        })
+        agent["turns"] += 1
+        agent["latency"].append(metrics["total"])
+        agent["ttft"].append(metrics.get("ttft", metrics["total"]))
+        agent["build_context"].append(metrics.get("build_context", 0.0))
+        agent["model"].extend(m["latency"] for m in metrics.get("model_calls", []))
+        agent["tool"].extend(t["latency"] for t in metrics.get("tool_calls", []))
+        agent["prompt_tokens"] += metrics.get("prompt_tokens", 0)
+        agent["completion_tokens"] += metrics.get("completion_tokens", 0)
+        agent["iterations"] += metrics.get("iterations", 0)
+
+    summary = {}
+    for role_id, agent in raw.items():
+        entry = {k: agent[k] for k in ("name", "turns", "prompt_tokens", "completion_tokens", "iterations")}
+        for key in ("latency", "ttft", "build_context", "model", "tool"):
+            entry[key] = {"p50": percentile(agent[key], 50), "p95": percentile(agent[key], 95)}
+        entry["tool_calls"] = len(agent["tool"])
+        summary[role_id] = entry
+    return summary
@@ -0,0 +1,75 @@
+import gzip
+import hashlib
+import json
+import os
+import uuid
+
+# 参与缓存键计算的请求字段；stream 等不影响回复内容的参数不计入
+KEY_FIELDS = ("model", "messages", "tools", "tool_choice", "seed")
+
+MODES = ("passthrough", "record", "replay")
+
+
+class ReplayMissError(Exception):
+    """replay 模式下请求未命中缓存"""
+
+
+class ReplayCache:
+    """
+    chat.completions.create 响应的内容寻址磁盘缓存，用于可复现、离线的重跑。
+
+    mode:
+      passthrough  不读不写，直接请求 API
+      record       正常请求 API，并把响应写入缓存（覆盖旧记录）
+      replay       只从缓存读取，不发起网络请求；未命中时抛出 ReplayMissError
+
+    每个响应以 gzip 压缩的 JSON 存放在 <dir>/<key[:2]>/<key[2:]>.json.gz，
+    先写临时文件再 os.replace 原子替换，多个进程可以同时读取。
+    """
+    def __init__(self, directory=".cache/replay", mode="passthrough"):
+        self.directory = directory
+        self.set_mode(mode)
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def set_mode(self, mode):
+        if mode not in MODES:
+            raise ValueError(f"未知的 replay 模式: {mode}，可选 {', '.join(MODES)}")
+        self.mode = mode
+
+    @property
+    def enabled(self):
+        return self.mode != "passthrough"
+
+    @staticmethod
+    def make_key(request_kwargs):
+        payload = {k: request_kwargs[k] for k in KEY_FIELDS if k in request_kwargs}
+        canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:] + ".json.gz")
+
+    def get(self, key):
+        """返回缓存的 {"message", "usage"}，未命中返回 None"""
+        try:
+            with gzip.open(self._path(key), 'rt', encoding='utf-8') as f:
+                record = json.load(f)
+        except (FileNotFoundError, OSError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return record
+
+    def put(self, key, message, usage):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+            json.dump({"message": message, "usage": usage}, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+        self.writes += 1
+
+    def stats(self):
+        return {"mode": self.mode, "hits": self.hits, "misses": self.misses, "writes": self.writes}
@@ -0,0 +1,277 @@
+import asyncio
+import random
+import re
+import time
+from email.utils import parsedate_to_datetime
+
+# 可重试的 HTTP 状态码：超时、冲突、限流与服务端错误（>= 500）
+RETRYABLE_STATUS = (408, 409, 429)
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+class CircuitOpenError(Exception):
+    """端点熔断中，请求未发出"""
+    def __init__(self, base_url, retry_in, model=None):
+        target = f"{base_url} ({model})" if model else base_url
+        super().__init__(f"{target} 已熔断，{retry_in:.1f}s 后重试")
+        self.base_url = base_url
+        self.model = model
+        self.retry_in = retry_in
+
+
+def is_retryable(error):
+    from openai import APIConnectionError, APIStatusError
+
+    if isinstance(error, APIConnectionError):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS or error.status_code >= 500
+    return False
+
+
+def _parse_duration(text):
+    """解析 "1s" / "6m0s" / "20ms" / "1.5" 形式的时长，返回秒"""
+    text = text.strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(text)
+    if not parts:
+        return None
+    return sum(float(value) * _DURATION_UNITS[unit] for value, unit in parts)
+
+
+def rate_limit_wait(headers):
+    """x-ratelimit-remaining-{requests,tokens} 为 0 时，距 x-ratelimit-reset-{requests,tokens} 的秒数"""
+    if not headers:
+        return None
+    waits = []
+    for kind in ("requests", "tokens"):
+        if headers.get(f"x-ratelimit-remaining-{kind}") == "0":
+            reset = _parse_duration(headers.get(f"x-ratelimit-reset-{kind}") or "")
+            if reset is not None:
+                waits.append(reset)
+    return max(waits) if waits else None
+
+
+def retry_after_seconds(headers):
+    """
+    从错误响应头读取服务端建议的等待秒数，依次尝试:
+      retry-after-ms、retry-after（秒数或 HTTP 日期）、rate_limit_wait
+    """
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return rate_limit_wait(headers)
+
+
+class CircuitBreaker:
+    """
+    三态熔断器:
+      closed    正常放行，连续失败达到 failure_threshold 次后转为 open
+      open      拒绝请求，reset_timeout 秒后转为 half_open
+      half_open 只放行一个探测请求，成功则 closed，失败则重新 open
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def retry_in(self):
+        """距离允许下一次请求的秒数，0 表示现在即可发出"""
+        if self.state == "closed":
+            return 0.0
+        if self.state == "open":
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                return remaining
+            self.state = "half_open"
+            self._probing = False
+        return self.reset_timeout if self._probing else 0.0
+
+    def allow(self):
+        if self.retry_in() > 0:
+            return False
+        if self.state == "half_open":
+            self._probing = True
+        return True
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_throttled(self):
+        """限流说明端点可用，不计入失败，只释放探测名额"""
+        self._probing = False
+
+    def release_probe(self):
+        """探测请求未得出结论（如被取消）时释放名额，允许下一个请求重新探测"""
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class EndpointGuard:
+    """
+    单个 (base_url, model) 的重试与熔断：带抖动的指数退避，遵循 Retry-After 与限流响应头。
+    成功响应的 x-ratelimit-* 头（observe）显示额度已用尽时，在重置前暂停发送，而不是等到服务端返回 429。
+    限流等待对使用同一端点、同一模型的所有角色生效（共享 _blocked_until）。
+    """
+    def __init__(self, base_url, model=None, max_attempts=5, base_delay=1.0, max_delay=60.0, failure_threshold=5,
+                 reset_timeout=30.0):
+        self.base_url = base_url
+        self.model = model
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._blocked_until = 0.0
+        self.retries = 0
+        self.failures = 0
+        # 因成功响应的限流头而主动等待的次数
+        self.throttle_waits = 0
+
+    def observe(self, headers):
+        """记录成功响应的限流头：额度用尽时，重置前的请求（所有共享本端点的角色）先等待"""
+        wait = rate_limit_wait(headers)
+        if wait:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + wait)
+            self.throttle_waits += 1
+
+    def backoff(self, attempt):
+        """第 attempt 次失败后的等待秒数（full jitter）"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def call(self, send, fail_fast=False, on_retry=None):
+        """
+        执行 send()（返回协程的函数），可重试错误按退避策略重发。
+        fail_fast=True 时熔断直接抛出 CircuitOpenError（由调用方切换备用模型），否则等待熔断恢复。
+        on_retry(attempt, error, delay) 在每次重试前回调。
+        """
+        attempt = 0
+        while True:
+            wait = self._blocked_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            if not self.breaker.allow():
+                retry_in = self.breaker.retry_in()
+                error = CircuitOpenError(self.base_url, retry_in, self.model)
+                attempt += 1
+                if fail_fast or attempt >= self.max_attempts:
+                    raise error
+                if on_retry:
+                    on_retry(attempt, error, retry_in)
+                await asyncio.sleep(retry_in)
+                continue
+
+            try:
+                result = await send()
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    # 端点给出了应答（如 400 / 401 / 内容过滤），说明服务可用，不计入熔断
+                    if getattr(e, "status_code", None) is not None:
+                        self.breaker.record_success()
+                    else:
+                        self.breaker.release_probe()
+                    raise
+                hint = retry_after_seconds(getattr(getattr(e, "response", None), "headers", None))
+                if getattr(e, "status_code", None) == 429:
+                    self.breaker.record_throttled()
+                else:
+                    self.breaker.record_failure()
+                self.failures += 1
+                attempt += 1
+                if attempt >= self.max_attempts:
+                    raise
+                delay = max(hint or 0.0, self.backoff(attempt))
+                if hint:
+                    self._blocked_until = max(self._blocked_until, time.monotonic() + hint)
+                self.retries += 1
+                if on_retry:
+                    on_retry(attempt, e, delay)
+                await asyncio.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            return result
+
+    def stats(self):
+        return {"state": self.breaker.state, "retries": self.retries, "failures": self.failures,
+                "throttle_waits": self.throttle_waits}
+
+
+def http_config_for(http_config, endpoint_guards):
+    """启用 EndpointGuards 时关闭 SDK 自带的重试，避免两层重试叠加"""
+    http_config = dict(http_config or {})
+    if endpoint_guards and endpoint_guards.enabled:
+        http_config["max_retries"] = 0
+    return http_config
+
+
+class EndpointGuards:
+    """
+    按 (base_url, model) 维护 EndpointGuard，可在多个 DialogueManager 之间共享（批量运行时）。
+    同一端点上的主模型与备用模型各自熔断，主模型熔断时备用模型仍可请求。
+    config 来自 config.json 的 "resilience" 部分:
+      enabled, max_attempts, base_delay, max_delay, failure_threshold, reset_timeout
+    """
+    def __init__(self, config=None):
+        self.config = config or {}
+        self._guards = {}
+
+    @property
+    def enabled(self):
+        return self.config.get("enabled", True)
+
+    def guard(self, base_url, model=None):
+        key = (base_url, model)
+        guard = self._guards.get(key)
+        if guard is None:
+            cfg = self.config
+            guard = EndpointGuard(
+                base_url,
+                model,
+                max_attempts=cfg.get("max_attempts", 5),
+                base_delay=cfg.get("base_delay", 1.0),
+                max_delay=cfg.get("max_delay", 60.0),
+                failure_threshold=cfg.get("failure_threshold", 5),
+                reset_timeout=cfg.get("reset_timeout", 30.0),
+            )
+            self._guards[key] = guard
+        return guard
+
+    def stats(self):
+        """{"<base_url> (<model>)": {...}}"""
+        return {
+            f"{base_url} ({model})" if model else base_url: guard.stats()
+            for (base_url, model), guard in self._guards.items()
+        }
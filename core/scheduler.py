@@ -0,0 +1,134 @@
+import random
+import re
+
+
+class TurnScheduler:
+    """
+    发言调度器基类。next_speakers 每一步返回本步发言的角色 ID 列表：
+    只有一个时按顺序发言；多于一个时这些角色基于同一历史快照并发生成，
+    并按列表顺序写入 global_history，保证结果可复现。
+    """
+    def __init__(self, agents, options=None):
+        # agents: {agent_id: ScamAgent}，保持 user.json 中的顺序
+        self.agents = agents
+        self.agent_ids = list(agents.keys())
+        self.options = options or {}
+
+    async def next_speakers(self, history, step):
+        raise NotImplementedError
+
+    def _next_after(self, history):
+        """紧接上一位发言者之后的角色（轮流顺序）"""
+        if not history or history[-1]["role_id"] not in self.agent_ids:
+            return self.agent_ids[0]
+        last = self.agent_ids.index(history[-1]["role_id"])
+        return self.agent_ids[(last + 1) % len(self.agent_ids)]
+
+
+class RoundRobinScheduler(TurnScheduler):
+    """按 user.json 中的顺序轮流发言"""
+    async def next_speakers(self, history, step):
+        return [self.agent_ids[step % len(self.agent_ids)]]
+
+
+class WeightedScheduler(TurnScheduler):
+    """按 user.json 中各角色的 weight（默认 1）随机抽取发言者，可用 seed 复现"""
+    def __init__(self, agents, options=None):
+        super().__init__(agents, options)
+        self.rng = random.Random(self.options.get("seed"))
+        self.weights = [agents[aid].weight for aid in self.agent_ids]
+        self.allow_repeat = self.options.get("allow_repeat", False)
+
+    async def next_speakers(self, history, step):
+        candidates, weights = self.agent_ids, self.weights
+        if not self.allow_repeat and history and len(self.agent_ids) > 1:
+            last = history[-1]["role_id"]
+            pairs = [(aid, w) for aid, w in zip(self.agent_ids, self.weights) if aid != last]
+            candidates, weights = [p[0] for p in pairs], [p[1] for p in pairs]
+        return self.rng.choices(candidates, weights=weights, k=1)
+
+
+class AddressedScheduler(TurnScheduler):
+    """
+    由上一条消息点名的角色发言：优先匹配 @ID / @姓名，其次匹配消息中最先出现的姓名；
+    无人被点名时按轮流顺序。
+    """
+    async def next_speakers(self, history, step):
+        if not history:
+            return [self.agent_ids[0]]
+        last = history[-1]
+        content = last["content"] or ""
+        best_pos, best_id = None, None
+        for aid in self.agent_ids:
+            if aid == last["role_id"]:
+                continue
+            name = self.agents[aid].name
+            for pattern in (f"@{aid}", f"@{name}", name):
+                pos = content.find(pattern)
+                if pos != -1:
+                    # @点名优先于普通提及
+                    rank = (0 if pattern.startswith("@") else 1, pos)
+                    if best_pos is None or rank < best_pos:
+                        best_pos, best_id = rank, aid
+                    break
+        return [best_id or self._next_after(history)]
+
+
+class ModelChosenScheduler(TurnScheduler):
+    """
+    由模型根据最近的对话选择下一位发言者。
+    options: chooser（用于调度请求的角色 ID，默认第一个角色）、chooser_model、window（参考的最近消息数）
+    """
+    async def next_speakers(self, history, step):
+        if not history:
+            return [self.agent_ids[0]]
+        chooser = self.agents.get(self.options.get("chooser"), self.agents[self.agent_ids[0]])
+        window = self.options.get("window", 10)
+        roster = "\n".join(f"- {aid}: {self.agents[aid].name}" for aid in self.agent_ids)
+        recent = "\n".join(f"[{m['role_name']}] {m['content']}" for m in history[-window:])
+        prompt = (
+            "你是多人对话的主持人。根据最近的对话，判断接下来最应该由谁发言。\n"
+            f"可选角色:\n{roster}\n\n最近的对话:\n{recent}\n\n"
+            "只回答一个角色 ID，不要输出其他内容。"
+        )
+        try:
+            answer = await chooser.complete([{"role": "user", "content": prompt}],
+                                            model=self.options.get("chooser_model"))
+        except Exception as e:
+            print(f"[WARN] 调度模型请求失败，改为轮流发言: {e}")
+            return [self._next_after(history)]
+        match = re.search("|".join(re.escape(aid) for aid in sorted(self.agent_ids, key=len, reverse=True)), answer)
+        return [match.group(0) if match else self._next_after(history)]
+
+
+class ParallelGroupScheduler(TurnScheduler):
+    """
+    按 groups 依次轮换，同组角色基于同一快照并发发言（如并行的旁支对话、只对公共快照作出反应的角色）。
+    未配置 groups 时所有角色为一组。
+    """
+    def __init__(self, agents, options=None):
+        super().__init__(agents, options)
+        groups = self.options.get("groups") or [self.agent_ids]
+        self.groups = [[aid for aid in group if aid in agents] for group in groups]
+        self.groups = [group for group in self.groups if group]
+
+    async def next_speakers(self, history, step):
+        return list(self.groups[step % len(self.groups)])
+
+
+SCHEDULERS = {
+    "round_robin": RoundRobinScheduler,
+    "weighted": WeightedScheduler,
+    "addressed": AddressedScheduler,
+    "model": ModelChosenScheduler,
+    "parallel": ParallelGroupScheduler,
+}
+
+
+def create_scheduler(agents, options=None):
+    """按 config.json 的 scheduler 配置创建调度器，policy 默认 round_robin"""
+    options = options or {}
+    policy = options.get("policy", "round_robin")
+    if policy not in SCHEDULERS:
+        raise ValueError(f"未知的调度策略: {policy}，可选 {', '.join(SCHEDULERS)}")
+    return SCHEDULERS[policy](agents, options)
@@ -0,0 +1,282 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from .journal import HistoryJournal
+
+# 索引结构有变化时递增，旧索引会被自动重建
+SCHEMA_VERSION = 2
+# 批量运行的结果汇总文件，不是对话历史
+SKIP_FILES = ("results.jsonl", "summary.json")
+
+
+def _fts_tokenizer(conn):
+    """
+    选择全文索引分词器：trigram 支持中文子串检索（SQLite >= 3.34），否则退回 unicode61；
+    不支持 FTS5 时返回 None，检索使用 LIKE。
+    """
+    for tokenizer in ("trigram", "unicode61"):
+        try:
+            conn.execute(f"CREATE VIRTUAL TABLE temp._fts_probe USING fts5(x, tokenize='{tokenizer}')")
+            conn.execute("DROP TABLE temp._fts_probe")
+            return tokenizer
+        except sqlite3.OperationalError:
+            continue
+    return None
+
+
+def _tool_names(entry):
+    """message_entry 的工具链中调用过的工具名"""
+    names = []
+    for thought in entry.get("internal_thoughts") or []:
+        for tool_call in thought.get("tool_calls") or []:
+            name = tool_call.get("function", {}).get("name")
+            if name:
+                names.append(name)
+    return names
+
+
+def _chain_hash(previous, entry):
+    """消息链哈希：覆盖从第一条到本条的全部消息，两个文件前 n 条相同当且仅当第 n 条的链哈希相同"""
+    digest = hashlib.blake2b(digest_size=12)
+    digest.update(previous.encode("ascii"))
+    for key in ("role_id", "timestamp", "content"):
+        digest.update(b"\x00" + str(entry.get(key) or "").encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _read_history(path):
+    """读取导出的 .json 或日志 .jsonl，不是对话历史的文件返回 None"""
+    if path.endswith(".jsonl"):
+        return HistoryJournal.load(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if not isinstance(data, list) or (data and not isinstance(data[0], dict)) or \
+            (data and "role_id" not in data[0]):
+        return None
+    return data
+
+
+class HistoryIndex:
+    """
+    history/ 下所有导出历史与日志的本地 SQLite 索引。
+    refresh() 按文件的 mtime / size 增量更新：只重新索引新增或变化的文件，并移除已删除文件的记录。
+    支持 content 全文检索（FTS5），按角色、工具名过滤，以及按角色统计工具调用次数。
+
+    同一会话通常同时留下日志 (.jsonl) 与导出 (.json)。内容是另一个文件前缀（或完全相同）的文件
+    视为重复，不参与检索与统计；完全相同时保留 .json 导出。从同一历史加载后各自继续的分支不是前缀关系，都会保留。
+    """
+    def __init__(self, db_path=".cache/history_index.sqlite", root="history"):
+        self.db_path = db_path
+        self.root = root
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.tokenizer = _fts_tokenizer(self.conn)
+        self._ensure_schema()
+
+    def _ensure_schema(self):
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        fts = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'"
+        ).fetchone() is not None
+        if version == SCHEMA_VERSION and fts == (self.tokenizer is not None):
+            return
+        with self.conn:
+            for table in ("messages_fts", "tool_calls", "messages", "files"):
+                self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self.conn.executescript("""
+                CREATE TABLE files (
+                    id INTEGER PRIMARY KEY, path TEXT UNIQUE, mtime REAL, size INTEGER, messages INTEGER,
+                    chain TEXT, active INTEGER DEFAULT 1
+                );
+                CREATE TABLE messages (
+                    id INTEGER PRIMARY KEY, file_id INTEGER, idx INTEGER,
+                    role_id TEXT, role_name TEXT, content TEXT, timestamp TEXT, chain TEXT
+                );
+                CREATE INDEX messages_file ON messages(file_id);
+                CREATE INDEX messages_chain ON messages(chain);
+                CREATE INDEX messages_role ON messages(role_id);
+                CREATE TABLE tool_calls (message_id INTEGER, file_id INTEGER, role_id TEXT, tool_name TEXT);
+                CREATE INDEX tool_calls_message ON tool_calls(message_id);
+                CREATE INDEX tool_calls_name ON tool_calls(tool_name);
+                CREATE INDEX tool_calls_file ON tool_calls(file_id);
+            """)
+            if self.tokenizer:
+                self.conn.execute(
+                    f"CREATE VIRTUAL TABLE messages_fts USING fts5(content, tokenize='{self.tokenizer}')"
+                )
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _scan(self):
+        """root 下（含批量运行的子目录）所有历史文件 -> (mtime, size)"""
+        found = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if not filename.endswith((".json", ".jsonl")) or filename in SKIP_FILES:
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found[os.path.normpath(path)] = (stat.st_mtime, stat.st_size)
+        return found
+
+    def _remove_file(self, file_id):
+        if self.tokenizer:
+            self.conn.execute(
+                "DELETE FROM messages_fts WHERE rowid IN (SELECT id FROM messages WHERE file_id = ?)", (file_id,)
+            )
+        self.conn.execute("DELETE FROM tool_calls WHERE file_id = ?", (file_id,))
+        self.conn.execute("DELETE FROM messages WHERE file_id = ?", (file_id,))
+        self.conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+    def _index_file(self, path, mtime, size, entries):
+        file_id = self.conn.execute(
+            "INSERT INTO files (path, mtime, size, messages) VALUES (?, ?, ?, ?)", (path, mtime, size, len(entries))
+        ).lastrowid
+        next_id = (self.conn.execute("SELECT MAX(id) FROM messages").fetchone()[0] or 0) + 1
+        messages, fts_rows, tool_rows = [], [], []
+        chain = ""
+        for idx, entry in enumerate(entries):
+            message_id = next_id + idx
+            content = entry.get("content") or ""
+            chain = _chain_hash(chain, entry)
+            messages.append((message_id, file_id, idx, entry.get("role_id"), entry.get("role_name"), content,
+                             entry.get("timestamp"), chain))
+            fts_rows.append((message_id, content))
+            for name in _tool_names(entry):
+                tool_rows.append((message_id, file_id, entry.get("role_id"), name))
+        self.conn.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?)", messages)
+        self.conn.execute("UPDATE files SET chain = ? WHERE id = ?", (chain or None, file_id))
+        self.conn.executemany("INSERT INTO tool_calls VALUES (?, ?, ?, ?)", tool_rows)
+        if self.tokenizer:
+            self.conn.executemany("INSERT INTO messages_fts (rowid, content) VALUES (?, ?)", fts_rows)
+
+    def refresh(self):
+        """增量更新索引，返回 {"added", "updated", "removed", "files", "elapsed"}"""
+        start = time.perf_counter()
+        found = self._scan()
+        known = {row["path"]: row for row in self.conn.execute("SELECT id, path, mtime, size FROM files")}
+        stats = {"added": 0, "updated": 0, "removed": 0}
+        with self.conn:
+            for path, row in known.items():
+                if path not in found:
+                    self._remove_file(row["id"])
+                    stats["removed"] += 1
+            for path, (mtime, size) in found.items():
+                row = known.get(path)
+                if row is not None and row["mtime"] == mtime and row["size"] == size:
+                    continue
+                try:
+                    entries = _read_history(path)
+                except (OSError, ValueError) as e:
+                    print(f"[WARN] 跳过无法解析的历史文件 {path}: {e}")
+                    entries = None
+                if row is not None:
+                    self._remove_file(row["id"])
+                # 无法解析的文件也记录 mtime/size，未变化时不再重复尝试
+                self._index_file(path, mtime, size, entries or [])
+                stats["updated" if row is not None else "added"] += 1
+            if stats["added"] or stats["updated"] or stats["removed"]:
+                self._mark_duplicates()
+        stats["files"] = len(found)
+        stats["elapsed"] = round(time.perf_counter() - start, 4)
+        return stats
+
+    @staticmethod
+    def _preference(path, file_id):
+        """内容相同的文件中保留哪一份：优先 .json 导出，其次较早索引的文件"""
+        return (path.endswith(".json"), -file_id)
+
+    def _mark_duplicates(self):
+        """重新计算 files.active：内容是其他文件前缀的文件标记为重复"""
+        files = self.conn.execute("SELECT id, path, messages, chain FROM files").fetchall()
+        inactive = []
+        for f in files:
+            if not f["chain"]:
+                inactive.append((f["id"],))
+                continue
+            # 其他文件中链哈希等于本文件最后一条的消息，说明本文件是它的前缀
+            for other in self.conn.execute(
+                "SELECT DISTINCT f.id, f.path, f.messages FROM messages m JOIN files f ON f.id = m.file_id "
+                "WHERE m.chain = ? AND m.file_id != ?", (f["chain"], f["id"])
+            ):
+                if other["messages"] > f["messages"] or (
+                    other["messages"] == f["messages"]
+                    and self._preference(other["path"], other["id"]) > self._preference(f["path"], f["id"])
+                ):
+                    inactive.append((f["id"],))
+                    break
+        self.conn.execute("UPDATE files SET active = 1")
+        self.conn.executemany("UPDATE files SET active = 0 WHERE id = ?", inactive)
+
+    def search(self, query="", agent=None, tool=None, limit=20):
+        """
+        全文检索 content，可按角色（ID 或姓名）与工具名过滤；query 为空时只按条件过滤。
+        返回 [{"path", "index", "role_id", "role_name", "timestamp", "content"}]，按索引顺序（同一文件内按序号）排列。
+        """
+        where, params = [], []
+        source = "messages m"
+        if query:
+            # trigram 至少需要 3 个字符，更短的查询使用 LIKE
+            if self.tokenizer and (self.tokenizer != "trigram" or len(query) >= 3):
+                source = "messages_fts JOIN messages m ON m.id = messages_fts.rowid"
+                where.append("messages_fts MATCH ?")
+                params.append('"' + query.replace('"', '""') + '"')
+            else:
+                where.append("m.content LIKE ? ESCAPE '\\'")
+                escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                params.append(f"%{escaped}%")
+        if agent:
+            where.append("(m.role_id = ? OR m.role_name = ?)")
+            params.extend([agent, agent])
+        if tool:
+            where.append("EXISTS (SELECT 1 FROM tool_calls t WHERE t.message_id = m.id AND t.tool_name = ?)")
+            params.append(tool)
+        sql = (f"SELECT f.path, m.idx, m.role_id, m.role_name, m.timestamp, m.content FROM {source} "
+               f"JOIN files f ON f.id = m.file_id")
+        where.append("f.active = 1")
+        sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY m.id LIMIT ?"
+        params.append(limit)
+        return [
+            {"path": row[0], "index": row[1], "role_id": row[2], "role_name": row[3], "timestamp": row[4],
+             "content": row[5]}
+            for row in self.conn.execute(sql, params)
+        ]
+
+    def tool_stats(self, agent=None):
+        """按角色与工具统计调用次数：[{"role_id", "role_name", "tool_name", "calls", "messages", "files"}]"""
+        sql = """
+            SELECT t.role_id, MAX(m.role_name), t.tool_name, COUNT(*),
+                   COUNT(DISTINCT t.message_id), COUNT(DISTINCT t.file_id)
+            FROM tool_calls t JOIN messages m ON m.id = t.message_id JOIN files f ON f.id = t.file_id
+            WHERE f.active = 1
+        """
+        params = []
+        if agent:
+            sql += " AND (t.role_id = ? OR m.role_name = ?)"
+            params.extend([agent, agent])
+        sql += " GROUP BY t.role_id, t.tool_name ORDER BY t.role_id, COUNT(*) DESC"
+        return [
+            {"role_id": row[0], "role_name": row[1], "tool_name": row[2], "calls": row[3], "messages": row[4],
+             "files": row[5]}
+            for row in self.conn.execute(sql, params)
+        ]
+
+    def stats(self):
+        files, messages = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(messages), 0) FROM files WHERE active = 1"
+        ).fetchone()
+        duplicates = self.conn.execute("SELECT COUNT(*) FROM files WHERE active = 0 AND messages > 0").fetchone()[0]
+        tool_calls = self.conn.execute(
+            "SELECT COUNT(*) FROM tool_calls t JOIN files f ON f.id = t.file_id WHERE f.active = 1"
+        ).fetchone()[0]
+        return {"files": files, "messages": messages, "tool_calls": tool_calls, "duplicates": duplicates,
+                "tokenizer": self.tokenizer}
+
+    def close(self):
+        self.conn.close()
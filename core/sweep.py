@@ -0,0 +1,193 @@
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from .batch import run_batch
+from .metrics import percentile
+
+
+def load_sweep_spec(path):
+    """
+    读取参数扫描描述文件，格式:
+    {
+      "output_dir": "history/sweep_xxx",      // 可选；同一目录重复运行时跳过已成功的场景
+      "workers": 4,                           // 进程数，默认 CPU 核数
+      "rounds": 20,
+      "configs": ["config.json", "config_budget.json"],
+      "users": ["user.json", "user_variant.json"],
+      "seeds": [1, 2, 3],                     // 可选，不填时每个组合只运行一次
+      "max_in_flight": 32,                    // 全局上限，按进程数平分（向下取整）
+      "rate_limits": {"<base_url>": 120},     // 全局每分钟请求数，按进程数平分（向下取整）
+      "max_conversations": 8,                 // 每个进程同时运行的对话数
+      "http": {...}, "resilience": {...}, "replay_mode": "replay"   // 同 batch
+    }
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _stem(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def expand_grid(spec):
+    """configs × users × seeds 展开为场景列表，名称由组合确定，便于断点续跑"""
+    configs = spec.get("configs") or ["config.json"]
+    users = spec.get("users") or ["user.json"]
+    seeds = spec.get("seeds") or [None]
+    scenarios = []
+    names = set()
+    for config in configs:
+        for user in users:
+            for seed in seeds:
+                name = f"{_stem(config)}__{_stem(user)}"
+                if seed is not None:
+                    name += f"__seed{seed}"
+                # 不同目录下的同名文件
+                base, n = name, 1
+                while name in names:
+                    n += 1
+                    name = f"{base}_{n}"
+                names.add(name)
+                scenario = {"name": name, "config": config, "user": user}
+                if seed is not None:
+                    scenario["seed"] = seed
+                scenarios.append(scenario)
+    return scenarios
+
+
+def read_results(output_dir):
+    """results.jsonl 中每个场景的最后一条结果"""
+    path = os.path.join(output_dir, "results.jsonl")
+    latest = {}
+    if not os.path.exists(path):
+        return latest
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            latest[result["name"]] = result
+    return latest
+
+
+def _split_limit(value, workers):
+    """全局上限按进程数平分（向下取整），各进程之和不超过全局上限"""
+    if not value or workers <= 1:
+        return value
+    return value // workers
+
+
+def _cap_workers(spec, workers):
+    """进程数不超过最小的全局上限，保证平分后每个进程至少分到 1"""
+    budgets = [spec.get("max_in_flight"), spec.get("default_rate"), *(spec.get("rate_limits") or {}).values()]
+    smallest = min((b for b in budgets if b), default=None)
+    if smallest is not None and smallest < workers:
+        capped = max(1, int(smallest))
+        print(f"[WARN] 全局上限 {smallest} 小于进程数 {workers}，进程数降为 {capped}")
+        return capped
+    return workers
+
+
+def _print_result(result):
+    status = "完成" if result["status"] == "ok" else f"失败 ({result.get('error')})"
+    print(f"[pid {os.getpid()}] [{result['name']}] {status} | {result['turns']} 条消息 | "
+          f"{result.get('duration', 0)}s", flush=True)
+
+
+def _run_shard(shard_spec):
+    """子进程入口：独立的事件循环与 DialogueManager，场景结果追加到共享的 results.jsonl"""
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    results = asyncio.run(run_batch(shard_spec, on_result=_print_result))
+    return [{"name": r["name"], "status": r["status"]} for r in results]
+
+
+def merge_results(output_dir):
+    """汇总所有场景的结果与各轮 metrics，写入 summary.json"""
+    results = read_results(output_dir)
+    latency, ttft = [], []
+    prompt_tokens = completion_tokens = turns = 0
+    for result in results.values():
+        turns += result.get("turns", 0)
+        path = result.get("path")
+        if result.get("status") != "ok" or not path or not os.path.exists(path):
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            history = json.load(f)
+        for msg in history:
+            metrics = msg.get("metrics") or {}
+            if "total" not in metrics:
+                continue
+            latency.append(metrics["total"])
+            ttft.append(metrics.get("ttft", metrics["total"]))
+            prompt_tokens += metrics.get("prompt_tokens", 0)
+            completion_tokens += metrics.get("completion_tokens", 0)
+
+    ok = sum(1 for r in results.values() if r.get("status") == "ok")
+    summary = {
+        "scenarios": len(results),
+        "ok": ok,
+        "failed": len(results) - ok,
+        "turns": turns,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "latency": {"p50": percentile(latency, 50), "p95": percentile(latency, 95)},
+        "ttft": {"p50": percentile(ttft, 50), "p95": percentile(ttft, 95)},
+        "results": sorted(results.values(), key=lambda r: r["name"]),
+    }
+    tmp_path = os.path.join(output_dir, "summary.json.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, os.path.join(output_dir, "summary.json"))
+    return summary
+
+
+def run_sweep(spec, workers=None, on_shard=None):
+    """
+    将参数网格中尚未成功的场景分片到进程池运行，每个进程内部按 batch 方式并发。
+    所有进程写入同一输出目录；中断后用同一 output_dir 重新运行即可续跑。
+    on_shard(done, total, shard_results) 在每个分片结束时回调。返回合并后的 summary。
+    """
+    output_dir = spec.get("output_dir") or os.path.join("history", f"sweep_{datetime.now().strftime('%m%d_%H%M%S')}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    completed = {name for name, r in read_results(output_dir).items() if r.get("status") == "ok"}
+    pending = [s for s in expand_grid(spec) if s["name"] not in completed]
+    if completed:
+        print(f"[*] 跳过已完成的 {len(completed)} 个场景，剩余 {len(pending)} 个")
+    if not pending:
+        return merge_results(output_dir)
+    # 失败或中断的场景留下的部分导出与日志会被重新生成，先删除，避免残留记录混入结果与检索索引
+    for scenario in pending:
+        for ext in (".json", ".jsonl"):
+            stale = os.path.join(output_dir, scenario["name"] + ext)
+            if os.path.exists(stale):
+                os.remove(stale)
+
+    workers = min(workers or spec.get("workers") or os.cpu_count() or 1, len(pending))
+    workers = _cap_workers(spec, workers)
+    # 轮流分配，使各进程的配置组合尽量均衡
+    shards = [pending[i::workers] for i in range(workers)]
+    base = {k: v for k, v in spec.items() if k not in ("configs", "users", "seeds", "workers")}
+    base["output_dir"] = output_dir
+    base["max_in_flight"] = _split_limit(spec.get("max_in_flight"), workers)
+    base["default_rate"] = _split_limit(spec.get("default_rate"), workers)
+    base["rate_limits"] = {url: _split_limit(rate, workers) for url, rate in (spec.get("rate_limits") or {}).items()}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_run_shard, dict(base, scenarios=shard)) for shard in shards]
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                shard_results = future.result()
+            except Exception as e:
+                # 单个进程崩溃不影响其他分片，已完成的场景已写入 results.jsonl
+                print(f"[ERROR] 分片运行失败: {e}")
+                shard_results = []
+            if on_shard:
+                on_shard(done, len(shards), shard_results)
+
+    return merge_results(output_dir)
@@ -0,0 +1,51 @@
+import json
+
+# 每条消息的格式开销（role、分隔符等），与 OpenAI 的计数方式一致
+MESSAGE_OVERHEAD = 4
+
+# None 表示尚未加载，False 表示 tiktoken 不可用；首次计数时才导入
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except ImportError:
+            print("[WARN] 未安装 tiktoken (见 requirements.txt)，token 数按字符粗略估算")
+            _encoding = False
+        except (OSError, ValueError) as e:
+            # 首次使用需下载词表，离线且无本地缓存 (TIKTOKEN_CACHE_DIR) 时失败
+            print(f"[WARN] tiktoken 词表加载失败，token 数按字符粗略估算: {e}")
+            _encoding = False
+    return _encoding
+
+
+def count_tokens(text):
+    """本地计算文本 token 数：使用 tiktoken 精确计数，tiktoken 不可用时才按字符粗略估算"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    # 后备估算（仅在 tiktoken 不可用时）：中日韩字符约 1 token/字，其余约 4 字符/token
+    cjk = sum(1 for ch in text if ord(ch) > 0x2E80)
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_message_tokens(message):
+    """估算一条 OpenAI 格式消息的 token 数（含工具调用参数）"""
+    tokens = MESSAGE_OVERHEAD + count_tokens(message.get("content") or "")
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call.get("function", {})
+        tokens += count_tokens(function.get("name", "")) + count_tokens(function.get("arguments", ""))
+    return tokens
+
+
+def count_tools_tokens(openai_tools):
+    """工具定义也会占用上下文"""
+    if not openai_tools:
+        return 0
+    return count_tokens(json.dumps(openai_tools, ensure_ascii=False))
@@ -0,0 +1,62 @@
+import json
+import time
+from collections import OrderedDict
+
+
+class ToolResultCache:
+    """
+    MCP 工具结果缓存：按 (server, 工具名, 规范化 JSON 参数) 缓存，带 TTL，
+    超出内存上限时按 LRU 淘汰。是否缓存某个工具由调用方 (MCPClientManager) 决定。
+    """
+    def __init__(self, max_bytes=8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (过期时间, 结果, 估算字节数)
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def make_key(server_name, tool_name, arguments):
+        args_json = json.dumps(arguments, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return f"{server_name}\x00{tool_name}\x00{args_json}"
+
+    def get(self, key):
+        """命中返回 (True, 结果)，未命中或已过期返回 (False, None)"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value, size = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, value
+            self._remove(key)
+        self.misses += 1
+        return False, None
+
+    def put(self, key, value, ttl):
+        size = len(key) + len(str(value).encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl, value, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self.bytes -= size
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
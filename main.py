@@ -1,19 +1,109 @@
+import argparse
 import asyncio
 import sys
+import time
 from core.manager import DialogueManager
+from core.metrics import summarize_metrics
 
-async def main():
+def fmt_pair(stat):
+    """格式化 p50/p95 耗时"""
+    if stat["p50"] is None:
+        return "-"
+    return f"{stat['p50']:.2f}/{stat['p95']:.2f}"
+
+def print_delta(text):
+    """流式输出：逐块打印回复片段"""
+    print(text, end="", flush=True)
+
+def parse_search_args(args):
+    """解析 search 指令参数: <关键词...> [--agent ID] [--tool 工具名] [--limit N]"""
+    options = {"agent": None, "tool": None, "limit": 20}
+    words = []
+    i = 0
+    while i < len(args):
+        key = args[i][2:]
+        if args[i].startswith("--") and key in options and i + 1 < len(args):
+            options[key] = int(args[i + 1]) if key == "limit" else args[i + 1]
+            i += 2
+        else:
+            words.append(args[i])
+            i += 1
+    return " ".join(words), options["agent"], options["tool"], options["limit"]
+
+def run_search(index, query, agent=None, tool=None, limit=20):
+    """增量刷新索引后检索并打印结果"""
+    refresh = index.refresh()
+    start = time.perf_counter()
+    results = index.search(query, agent=agent, tool=tool, limit=limit)
+    elapsed = (time.perf_counter() - start) * 1000
+    print("\n" + "="*80)
+    for r in results:
+        preview = r["content"].replace('\n', ' ')
+        if len(preview) > 60:
+            preview = preview[:57] + "..."
+        print(f"{r['path']}#{r['index']:03d} | {r['role_name']:<10} | {preview}")
+    print("="*80)
+    stats = index.stats()
+    print(f"{len(results)} 条结果 (上限 {limit}) | 检索 {elapsed:.1f}ms | 索引 {stats['files']} 个文件 / "
+          f"{stats['messages']} 条消息 (跳过 {stats['duplicates']} 个重复文件) | 更新 {refresh['added'] + refresh['updated']} 个文件 {refresh['elapsed'] * 1000:.0f}ms")
+
+def run_tool_stats(index, agent=None):
+    """按角色统计所有历史中的工具调用次数"""
+    index.refresh()
+    rows = index.tool_stats(agent)
+    if not rows:
+        print("索引的历史中没有工具调用。")
+        return
+    print("\n" + "="*72)
+    print(f"{'角色':<10} | {'工具':<24} | {'调用次数':>8} | {'消息数':>6} | {'文件数':>6}")
+    print("-" * 72)
+    for r in rows:
+        print(f"{r['role_name'] or r['role_id']:<10} | {r['tool_name']:<24} | {r['calls']:>8} | "
+              f"{r['messages']:>6} | {r['files']:>6}")
+    print("="*72)
+
+def open_history_index(db_path=None, root=None):
+    from core.search import HistoryIndex
+
+    return HistoryIndex(db_path or ".cache/history_index.sqlite", root or "history")
+
+# 离线模式 (--no-init) 下不可用的指令：需要模型或 MCP 服务
+ONLINE_COMMANDS = ("speak", "auto", "status")
+
+async def main(replay_mode=None, offline=False, load_path=None):
     manager = DialogueManager()
+    if replay_mode:
+        manager.replay_cache.set_mode(replay_mode)
+        print(f"模型响应回放模式: {replay_mode}")
     print("--- MASS: Multi-Agent Scam Interaction Framework ---")
-    print("正在初始化 Agent...")
-    await manager.initialize_agents()
-    
-    # 打印初始角色状态
-    print("\n[已加载角色]")
-    for aid, agent in manager.agents.items():
-        print(f" - ID: {aid:12} | 姓名: {agent.name}")
+    if offline:
+        print("离线模式：不构建角色、不连接模型与 MCP 服务，可浏览、删除、导出与加载历史。")
+    else:
+        # lazy_init（默认开启）时工具推迟到各角色首次发言时加载
+        lazy = manager.config.get("lazy_init", True)
+        print("正在初始化 Agent...")
+        report = await manager.initialize_agents(lazy=lazy)
+        print(f"初始化完成，用时 {report['total']:.2f}s "
+              f"(构建角色 {report['construct_agents']:.2f}s | 加载工具 {report['init_tools']:.2f}s)")
+        if lazy:
+            print("  工具将在各角色首次发言时加载。")
+        for name, stats in report["mcp_servers"].items():
+            source = "磁盘缓存" if stats["source"] == "cache" else "服务器"
+            print(f"  MCP {name:16} | {stats['tools']} 个工具 | 来源: {source} | "
+                  f"连接 {stats['connect']:.2f}s | 转换 {stats['convert']:.2f}s")
+
+        # 打印初始角色状态
+        print("\n[已加载角色]")
+        for aid, agent in manager.agents.items():
+            print(f" - ID: {aid:12} | 姓名: {agent.name}")
+
+    if load_path:
+        await manager.load_history(load_path)
+        print(f"已加载历史: {load_path} ({len(manager.global_history)} 条消息)")
     
     print("\n系统就绪。输入 'help' 查看指令。")
+    # 历史检索索引 (core.search)，首次 search / toolstats 时打开
+    history_index = None
 
     while True:
         try:
@@ -24,8 +114,13 @@ async def main():
             cmd = cmd_input[0].lower()
             args = cmd_input[1:]
 
+            if offline and cmd in ONLINE_COMMANDS:
+                print(f"离线模式下不可用: {cmd}（去掉 --no-init 重新启动）")
+                continue
+
             if cmd == "exit":
-                if manager.config.get("save_on_exit"):
+                # 离线模式不产生新消息，不自动保存
+                if manager.config.get("save_on_exit") and not offline:
                     path = manager.export_history()
                     print(f"已自动保存历史至: {path}")
                 break
@@ -35,8 +130,8 @@ async def main():
                 print(f"{'序号':<4} | {'角色':<10} | {'属性':<8} | {'消息内容'}")
                 print("-" * 60)
                 for i, msg in enumerate(manager.global_history):
-                    # 检查是否有工具调用
-                    has_tools = "TOOL" if msg.get('internal_thoughts') else "TEXT"
+                    # 检查是否有工具调用（无需还原工具链）
+                    has_tools = "TOOL" if msg.has_tools else "TEXT"
                     content_preview = msg['content'].replace('\n', ' ')
                     # 截断过长内容
                     if len(content_preview) > 50:
@@ -53,7 +148,7 @@ async def main():
                     idx = int(args[0])
                     removed = manager.delete_message(idx)
                     if removed:
-                        has_tools = " (含工具调用)" if removed.get('internal_thoughts') else ""
+                        has_tools = " (含工具调用)" if removed.has_tools else ""
                         print(f"[成功] 已删除序号 {idx}{has_tools}: [{removed['role_name']}]")
                     else:
                         print(f"[错误] 无效的序号: {idx}")
@@ -66,9 +161,17 @@ async def main():
                     continue
                 agent_id = args[0]
                 print(f"[*] 正在等待 {agent_id} 回复...")
-                msg = await manager.agent_speak(agent_id)
+                streaming = manager.streaming and agent_id in manager.agents
+                if streaming:
+                    # 流式模式：回复片段到达即打印
+                    print(f"\n[{manager.agents[agent_id].name}]: ", end="", flush=True)
+                    msg = await manager.agent_speak(agent_id, on_delta=print_delta)
+                    print()
+                else:
+                    msg = await manager.agent_speak(agent_id)
                 if msg:
-                    print(f"\n[{msg['role_name']}]: {msg['content']}")
+                    if not streaming:
+                        print(f"\n[{msg['role_name']}]: {msg['content']}")
                     if msg.get('internal_thoughts'):
                         print(f"    (触发了 {len(msg['internal_thoughts'])//2} 次工具交互)")
 
@@ -78,16 +181,28 @@ async def main():
                     continue
                 try:
                     n = int(args[0])
-                    agent_ids = list(manager.agents.keys())
-                    if not agent_ids:
+                    if not manager.agents:
                         print("错误：没有角色。")
                         continue
-                    
-                    for i in range(n):
-                        agent_id = agent_ids[i % len(agent_ids)]
-                        print(f"[*] ({i+1}/{n}) {agent_id} 正在思考...")
-                        msg = await manager.agent_speak(agent_id)
-                        print(f"[{msg['role_name']}]: {msg['content']}")
+
+                    # 只有单人发言的步骤会流式输出，多人并发的步骤在生成完后统一打印
+                    step_streaming = False
+
+                    def announce(i, agent_ids):
+                        nonlocal step_streaming
+                        step_streaming = manager.streaming and len(agent_ids) == 1
+                        print(f"[*] ({i+1}/{n}) {', '.join(agent_ids)} 正在思考...")
+                        if step_streaming:
+                            print(f"[{manager.agents[agent_ids[0]].name}]: ", end="", flush=True)
+
+                    def show(i, msg):
+                        if step_streaming:
+                            print()
+                        else:
+                            print(f"[{msg['role_name']}]: {msg['content']}")
+
+                    await manager.run_auto(n, on_turn=announce, on_message=show,
+                                           on_delta=print_delta if manager.streaming else None)
                 except ValueError:
                     print("参数错误")
 
@@ -96,6 +211,13 @@ async def main():
                 path = manager.export_history(name)
                 print(f"历史记录已导出至: {path}")
 
+            elif cmd == "compact":
+                path = manager.compact_journal()
+                if path:
+                    print(f"日志已压缩: {path}")
+                else:
+                    print("未开启日志 (config.json 中 journal.enabled)")
+
             elif cmd == "load":
                 if not args:
                     print("用法: load <path>")
@@ -106,8 +228,61 @@ async def main():
             elif cmd == "status":
                 print("\n--- 角色状态与私有工具 ---")
                 for aid, agent in manager.agents.items():
-                    tools_str = ", ".join([t.name for t in agent.tools_map.values()]) if agent.tools_map else "无"
+                    if not agent.tools_loaded:
+                        tools_str = "未加载 (首次发言时加载)"
+                    else:
+                        tools_str = ", ".join([t.name for t in agent.tools_map.values()]) if agent.tools_map else "无"
                     print(f"ID: {aid:12} | 姓名: {agent.name:10} | 私有工具: {tools_str}")
+                if manager.mcp_manager.servers:
+                    print("\n--- MCP 服务会话 ---")
+                    health = await manager.mcp_manager.health_check()
+                    for name, ok in health.items():
+                        print(f"{name:20} | {'正常' if ok else '不可用'}")
+
+            elif cmd == "stats":
+                summary = summarize_metrics(manager.global_history)
+                if not summary:
+                    print("暂无统计数据 (仅统计本版本生成的消息)。")
+                    continue
+                print("\n" + "="*100)
+                print(f"{'角色':<10} | {'轮数':>4} | {'总耗时 p50/p95':>14} | {'首token':>11} | {'模型往返':>11} | "
+                      f"{'工具调用':>11} | {'构建上下文':>10} | {'tokens 输入/输出':>16} | {'平均迭代':>6}")
+                print("-" * 100)
+                for aid, st in summary.items():
+                    tokens = f"{st['prompt_tokens']}/{st['completion_tokens']}"
+                    build = f"{st['build_context']['p50'] * 1000:.1f}ms"
+                    iterations = st['iterations'] / st['turns']
+                    print(f"{st['name']:<10} | {st['turns']:>4} | {fmt_pair(st['latency']):>14} | {fmt_pair(st['ttft']):>11} | "
+                          f"{fmt_pair(st['model']):>11} | {fmt_pair(st['tool']):>11} | {build:>10} | {tokens:>16} | {iterations:>6.1f}")
+                print("="*100)
+                print("耗时单位为秒 (p50/p95)；工具调用为单次调用耗时。")
+                replay = manager.replay_cache.stats()
+                if replay["mode"] != "passthrough":
+                    print(f"回放缓存 ({replay['mode']}): 命中 {replay['hits']} | 未命中 {replay['misses']} | 写入 {replay['writes']}")
+                cache = manager.mcp_manager.result_cache.stats()
+                if cache["hits"] or cache["misses"]:
+                    print(f"工具结果缓存: 命中 {cache['hits']} | 未命中 {cache['misses']} | "
+                          f"淘汰 {cache['evictions']} | {cache['entries']} 条 / {cache['bytes'] / 1024:.1f} KB")
+                for endpoint, ep in manager.endpoint_guards.stats().items():
+                    if ep["retries"] or ep["throttle_waits"] or ep["state"] != "closed":
+                        print(f"端点 {endpoint}: 熔断状态 {ep['state']} | 重试 {ep['retries']} | 失败 {ep['failures']} | "
+                              f"限流等待 {ep['throttle_waits']}")
+
+            elif cmd == "search":
+                if not args:
+                    print("用法: search <关键词> [--agent ID] [--tool 工具名] [--limit N]")
+                    continue
+                try:
+                    query, agent, tool, limit = parse_search_args(args)
+                except ValueError:
+                    print("[错误] --limit 必须是整数")
+                    continue
+                history_index = history_index or open_history_index()
+                run_search(history_index, query, agent, tool, limit)
+
+            elif cmd == "toolstats":
+                history_index = history_index or open_history_index()
+                run_tool_stats(history_index, args[0] if args else None)
 
             elif cmd == "help":
                 print("""
@@ -115,10 +290,14 @@ async def main():
   list / show   列出消息，标记 [TOOL] 表示该轮对话包含隐藏的工具调用
   delete <n>    删除序号 <n> 的消息 (及其关联的所有隐藏工具调用)
   speak <id>    强制指定 ID 为 <id> 的角色生成下一条回复
-  auto <n>      按照 user.json 中的顺序自动循环对话 <n> 轮
-  status        查看当前已加载的角色及其关联的私有工具
+  auto <n>      由调度器 (config.json 的 scheduler) 自动推进对话 <n> 步
+  stats         按角色统计耗时 (p50/p95) 与 token 用量
+  status        查看当前已加载的角色、私有工具及 MCP 会话健康状态
   export [name] 将当前对话状态保存至 ./history/[name].json
-  load <path>   从指定文件导入对话记录
+  load <path>   从指定文件导入对话记录 (导出的 .json 或日志 .jsonl)
+  compact       压缩当前会话日志，清除删除留下的墓碑记录
+  search <词>   检索 ./history 下所有导出历史与日志 (--agent ID / --tool 工具名 / --limit N)
+  toolstats [id] 按角色统计所有历史中的工具调用次数
   exit          退出并根据配置自动保存
                 """)
             else:
@@ -130,7 +309,84 @@ async def main():
         except Exception as e:
             print(f"\n[运行时错误]: {e}")
 
+    if history_index:
+        history_index.close()
+    await manager.shutdown()
+
+async def batch_main(spec_path, replay_mode=None):
+    """无交互批量模式：并发运行描述文件中的所有场景"""
+    from core.batch import load_batch_spec, run_batch
+
+    spec = load_batch_spec(spec_path)
+    if replay_mode:
+        spec["replay_mode"] = replay_mode
+    print(f"--- MASS 批量运行: {len(spec.get('scenarios', []))} 个场景 ---")
+
+    def report(result):
+        status = "完成" if result["status"] == "ok" else f"失败 ({result.get('error')})"
+        print(f"[{result['name']}] {status} | {result['turns']} 条消息 | {result.get('duration', 0)}s")
+
+    results = await run_batch(spec, on_result=report)
+    ok = sum(1 for r in results if r["status"] == "ok")
+    print(f"\n全部结束: 成功 {ok}/{len(results)}")
+
+def sweep_main(spec_path, workers=None, replay_mode=None):
+    """多进程参数扫描：configs × users × seeds 分片到进程池运行，可断点续跑"""
+    from core.sweep import expand_grid, load_sweep_spec, run_sweep
+
+    spec = load_sweep_spec(spec_path)
+    if replay_mode:
+        spec["replay_mode"] = replay_mode
+    print(f"--- MASS 参数扫描: {len(expand_grid(spec))} 个场景 ---")
+
+    def report(done, total, shard_results):
+        ok = sum(1 for r in shard_results if r["status"] == "ok")
+        print(f"[*] 分片 {done}/{total} 结束: 成功 {ok}/{len(shard_results)}")
+
+    summary = run_sweep(spec, workers=workers, on_shard=report)
+    latency = summary["latency"]
+    print(f"\n全部结束: 成功 {summary['ok']}/{summary['scenarios']} | {summary['turns']} 条消息 | "
+          f"tokens {summary['prompt_tokens']}/{summary['completion_tokens']} | 每轮耗时 p50/p95 {fmt_pair(latency)}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="MASS: Multi-Agent Scam Interaction Framework")
+    parser.add_argument("--replay", choices=["passthrough", "record", "replay"],
+                        help="模型响应回放模式，覆盖 config.json 中的 replay.mode")
+    parser.add_argument("--no-init", action="store_true",
+                        help="离线模式：不初始化角色与工具，只浏览 / 导出历史")
+    parser.add_argument("--load", metavar="PATH", help="启动后加载历史文件 (.json 或 .jsonl)")
+    subparsers = parser.add_subparsers(dest="command")
+    batch_parser = subparsers.add_parser("batch", help="无交互批量运行多个场景")
+    batch_parser.add_argument("spec", help="批量运行描述文件 (JSON)")
+    sweep_parser = subparsers.add_parser("sweep", help="多进程参数扫描 (configs × users × seeds)")
+    sweep_parser.add_argument("spec", help="参数扫描描述文件 (JSON)")
+    sweep_parser.add_argument("--workers", type=int, help="进程数，默认取描述文件的 workers 或 CPU 核数")
+    search_parser = subparsers.add_parser("search", help="检索所有导出的历史")
+    search_parser.add_argument("query", nargs="?", default="", help="全文检索关键词，为空时只按条件过滤")
+    search_parser.add_argument("--agent", help="角色 ID 或姓名")
+    search_parser.add_argument("--tool", help="调用过的工具名")
+    search_parser.add_argument("--limit", type=int, default=20)
+    toolstats_parser = subparsers.add_parser("toolstats", help="按角色统计所有历史中的工具调用次数")
+    toolstats_parser.add_argument("--agent", help="角色 ID 或姓名")
+    for sub in (search_parser, toolstats_parser):
+        sub.add_argument("--root", default="history", help="历史目录")
+        sub.add_argument("--db", default=".cache/history_index.sqlite", help="索引文件")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    cli_args = parse_args()
     if sys.platform == 'win32':
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-    asyncio.run(main())
\ No newline at end of file
+    if cli_args.command == "batch":
+        asyncio.run(batch_main(cli_args.spec, cli_args.replay))
+    elif cli_args.command == "sweep":
+        sweep_main(cli_args.spec, cli_args.workers, cli_args.replay)
+    elif cli_args.command in ("search", "toolstats"):
+        history_index = open_history_index(cli_args.db, cli_args.root)
+        if cli_args.command == "search":
+            run_search(history_index, cli_args.query, cli_args.agent, cli_args.tool, cli_args.limit)
+        else:
+            run_tool_stats(history_index, cli_args.agent)
+        history_index.close()
+    else:
+        asyncio.run(main(cli_args.replay, offline=cli_args.no_init, load_path=cli_args.load))
\ No newline at end of file